@@ -34,4 +34,10 @@ OTHER DEALINGS IN THE SOFTWARE.
 """
 
 __license__ = __doc__
-from userconfig import UserConfig, __version__
\ No newline at end of file
+from userconfig import (UserConfig, NoDefault, __version__,
+                        FSYNC_NONE, FSYNC_FILE, FSYNC_DIR)
+from codec import LiteralCodec, JSONCodec
+from migration import Rename, MoveSection, Transform, Drop
+from schema import Schema
+from storage import FileStorage, MemoryStorage, SQLiteStorage
+from layers import LayeredConfig
\ No newline at end of file
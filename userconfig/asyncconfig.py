@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+userconfig for asyncio
+======================
+
+AsyncUserConfig: UserConfig for asyncio event loops (requires trollius,
+the asyncio port to Python 2), storage being read and written in an
+executor so that the event loop is never blocked (this module is not
+imported by the userconfig package, trollius being long to import):
+
+    from userconfig.asyncconfig import AsyncUserConfig
+
+    @asyncio.coroutine
+    def main():
+        conf = AsyncUserConfig('app_name', defaults)
+        yield From(conf.load())
+        conf.set('Font', 'size', 12)
+        print conf.get('Font', 'size')
+        yield From(conf.save())
+        changed = yield From(conf.reload_if_changed())
+"""
+
+try:
+    import trollius as asyncio
+    from trollius import From, Return
+except ImportError:
+    asyncio = None
+
+from userconfig import UserConfig
+
+
+def coroutine(function):
+    """asyncio.coroutine decorator (if asyncio is available)"""
+    if asyncio is None:
+        return function
+    return asyncio.coroutine(function)
+
+class AsyncUserConfig(object):
+    """
+    UserConfig for asyncio event loops
+    Arguments are those of UserConfig, and:
+    loop: event loop (default: current event loop)
+    executor: executor running storage I/O (default: loop default executor)
+    save_delay: see UserConfig (changed options are always saved in
+                background, so that setting options does not block)
+    Options may only be accessed once loaded (see 'load' coroutine);
+    storage is not checked for modifications on access (UserConfig
+    'auto_reload'), see 'reload_if_changed' coroutine instead
+    """
+    # UserConfig methods which don't block (config being saved in background)
+    delegated = ('get', 'get_default', 'get_section', 'get_many', 'set',
+                 'update', 'set_section', 'set_default', 'remove_option',
+                 'remove_section', 'add_section', 'has_section', 'has_option',
+                 'sections', 'options', 'items', 'batch', 'subscribe',
+                 'unsubscribe', 'has_unsaved_changes', 'get_cache_info',
+                 'enable_stats', 'disable_stats', 'stats', 'filename')
+
+    def __init__(self, name, defaults=None, loop=None, executor=None,
+                 save_delay=0, **kwargs):
+        if asyncio is None:
+            raise ImportError("AsyncUserConfig requires the trollius module")
+        if save_delay is None:
+            raise RuntimeError("AsyncUserConfig requires background saving")
+        if kwargs.get('auto_reload') is not None:
+            raise RuntimeError("AsyncUserConfig does not support "
+                               "auto_reload: see 'reload_if_changed'")
+        self.config = UserConfig(name, defaults, lazy=True,
+                                 save_delay=save_delay, **kwargs)
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        self.loop = loop
+        self.executor = executor
+        self._lock = asyncio.Lock(loop=loop)
+        self._loaded = False
+
+    def __getattr__(self, name):
+        """
+        Return UserConfig non-blocking methods (once config is loaded)
+        """
+        if name in self.delegated:
+            if not self._loaded:
+                raise RuntimeError("Config has not been loaded yet "
+                                   "(see 'load')")
+            return getattr(self.config, name)
+        raise AttributeError("%r object has no attribute %r"
+                             % (self.__class__.__name__, name))
+
+    def __run(self, function, *args):
+        """
+        Private method running function(*args) in executor: return a future
+        """
+        return self.loop.run_in_executor(self.executor, function, *args)
+
+    @coroutine
+    def load(self):
+        """
+        Load (and upgrade) config (see UserConfig constructor)
+        """
+        with (yield From(self._lock)):
+            if not self._loaded:
+                # Getting version loads the config (created in lazy mode)
+                yield From(self.__run(self.config.get_version))
+                self._loaded = True
+
+    @coroutine
+    def save(self):
+        """
+        Save config (options set with save=False included) and wait until
+        it is written
+        """
+        if not self._loaded:
+            return
+        with (yield From(self._lock)):
+            self.config.save()
+            yield From(self.__run(self.config.flush))
+
+    @coroutine
+    def reload_if_changed(self):
+        """
+        Reload config if storage has been modified (e.g. by another process)
+        since it was loaded or saved: return the list of (section, option)
+        whose value changed (see UserConfig 'reload')
+        """
+        if not self._loaded:
+            raise Return([])
+        with (yield From(self._lock)):
+            while True:
+                stored = yield From(self.__run(self.__read_changed))
+                if stored is None:
+                    raise Return([])
+                # Options saved while reading: stored options are outdated
+                if not self.config.has_unsaved_changes() and \
+                   self.config._file_stat == stored.saved_stat:
+                    break
+            changed = self.config.reload(stored)
+        raise Return(changed)
+
+    def __read_changed(self):
+        """
+        Private method reading storage if it has been modified (executor)
+        """
+        config = self.config
+        config.flush()
+        saved_stat = config._file_stat
+        if config.storage.stat() == saved_stat:
+            return
+        stored = config.read_storage()
+        stored.saved_stat = saved_stat
+        return stored
+
+    @coroutine
+    def close(self):
+        """
+        Write pending changes and release resources (see UserConfig 'close')
+        """
+        with (yield From(self._lock)):
+            if self._loaded:
+                yield From(self.__run(self.config.close))
@@ -0,0 +1,696 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+userconfig benchmarks
+(run from a temporary home directory, so that no user file is touched)
+See also 'benchsuite' module: main operations at several config sizes,
+with JSON results which may be compared between runs
+"""
+
+from __future__ import with_statement
+
+import os, time, shutil, tempfile, threading
+from ConfigParser import RawConfigParser
+
+from userconfig import UserConfig, FSYNC_NONE, FSYNC_FILE, FSYNC_DIR
+from codec import literal_eval, JSONCodec
+from migration import Rename, Drop
+from schema import Schema
+from storage import FileStorage, MemoryStorage, SQLiteStorage
+from asyncconfig import AsyncUserConfig, asyncio
+from layers import LayeredConfig
+from stream import iter_options, read_config, write_config, patch_config
+
+
+def best_of(func, repeat=3):
+    """Return the best wall-clock time (in seconds) of 'repeat' calls"""
+    times = []
+    for _index in range(repeat):
+        start = time.time()
+        func()
+        times.append(time.time()-start)
+    return min(times)
+
+def get_rss():
+    """Return resident memory size of current process, in kB (Linux)"""
+    try:
+        statm = file('/proc/self/statm').read().split()
+    except IOError:
+        return 0
+    return int(statm[1])*os.sysconf('SC_PAGE_SIZE')/1024
+
+def make_options(sections, options):
+    """Return defaults made of 'sections' x 'options' int options"""
+    return [ ('section%d' % sec,
+              dict([ ('option%d' % opt, opt) for opt in range(options) ]))
+             for sec in range(sections) ]
+
+def bench_batch(count=300):
+    """set() with save=True versus the same calls inside a batch"""
+    conf = UserConfig('benchconfig', make_options(1, count))
+    # Values change on each run, so that every call writes the file
+    runs = [0]
+    def unbatched():
+        runs[0] += 1
+        for index in range(count):
+            conf.set('section0', 'option%d' % index, index+runs[0])
+    def batched():
+        runs[0] += 1
+        with conf.batch():
+            for index in range(count):
+                conf.set('section0', 'option%d' % index, index+runs[0])
+    for label, func in (('set(save=True)', unbatched),
+                        ('batch()', batched)):
+        elapsed = best_of(func)
+        print '%-20s %6d sets: %8.4f s  (%10.0f sets/s)' % \
+              (label, count, elapsed, count/elapsed)
+    conf.cleanup()
+
+def bench_get_default(sections=1000, options=50):
+    """get_default() lookups versus a linear scan of the defaults list"""
+    defaults = make_options(sections, options)
+    conf = UserConfig('benchconfig', defaults, load=False)
+    keys = [ ('section%d' % sec, 'option%d' % opt)
+             for sec in range(0, sections, 7) for opt in range(options) ]
+    def linear_scan():
+        for section, option in keys:
+            for sec, opts in defaults:
+                if sec == section and option in opts:
+                    break
+    def indexed():
+        for section, option in keys:
+            conf.get_default(section, option)
+    for label, func in (('linear scan', linear_scan),
+                        ('get_default()', indexed)):
+        elapsed = best_of(func)
+        print '%-20s %6d lookups: %8.4f s  (%10.0f lookups/s)' % \
+              (label, len(keys), elapsed, len(keys)/elapsed)
+    conf.cleanup()
+
+def bench_get_cache(options=40, loops=1000):
+    """Repeated get() of the same options (decoded values cache)"""
+    defaults = [('section', dict([ ('option%d' % index, [index, 'text'])
+                                   for index in range(options) ]))]
+    conf = UserConfig('benchconfig', defaults, load=False)
+    names = [ 'option%d' % index for index in range(options) ]
+    def cold():
+        for _index in range(loops):
+            conf._decoded.clear()
+            for option in names:
+                conf.get('section', option)
+    def warm():
+        for _index in range(loops):
+            for option in names:
+                conf.get('section', option)
+    count = options*loops
+    for label, func in (('get() uncached', cold), ('get() cached', warm)):
+        elapsed = best_of(func)
+        print '%-20s %6d gets: %8.4f s  (%10.0f gets/s)' % \
+              (label, count, elapsed, count/elapsed)
+    print 'cache info:', conf.get_cache_info()
+    conf.cleanup()
+
+def bench_codec(loops=10000):
+    """eval versus the literal and JSON codecs, for scalars and a long list"""
+    json_loads = JSONCodec().decode
+    cases = [ ('bool', 'True', loops), ('int', '1234', loops),
+              ('float', '12.5', loops), ('str', repr('text text'), loops),
+              ('list[10k]', repr(range(10000)), 10),
+              ('strlist[10k]', repr(map(str, range(10000))), 10) ]
+    for label, text, count in cases:
+        for name, func in (('eval', eval), ('literal_eval', literal_eval),
+                           ('json', json_loads)):
+            def decode():
+                for _index in xrange(count):
+                    func(text)
+            try:
+                elapsed = best_of(decode)
+            except ValueError:
+                continue
+            print '%-12s %-13s %6d decodes: %8.4f s  (%10.0f decodes/s)' % \
+                  (label, name, count, elapsed, count/elapsed)
+
+def bench_startup(configs=10, sections=20, options=50):
+    """Creating several configs at startup, eagerly or lazily"""
+    defaults = make_options(sections, options)
+    names = [ 'benchconfig%d' % index for index in range(configs) ]
+    for name in names:
+        UserConfig(name, defaults)
+    for label, lazy in (('UserConfig()', False),
+                        ('UserConfig(lazy=True)', True)):
+        def startup():
+            for name in names:
+                UserConfig(name, defaults, lazy=lazy)
+        elapsed = best_of(startup)
+        print '%-22s %3d configs: %8.4f s  (%8.2f ms/config)' % \
+              (label, configs, elapsed, 1000*elapsed/configs)
+    for name in names:
+        UserConfig(name, defaults, load=False).cleanup()
+
+def bench_fsync(count=100, options=100):
+    """set(save=True) cost for each fsync policy of atomic saves"""
+    defaults = make_options(1, options)
+    for fsync in (FSYNC_NONE, FSYNC_FILE, FSYNC_DIR):
+        conf = UserConfig('benchconfig', defaults, fsync=fsync)
+        def save():
+            for index in range(count):
+                conf.set('section0', 'option0', index)
+        elapsed = best_of(save)
+        print 'fsync=%-5s %6d saves: %8.4f s  (%8.3f ms/save)' % \
+              (fsync, count, elapsed, 1000*elapsed/count)
+        conf.cleanup()
+
+def set_in_process(index, count, merge):
+    """Worker of bench_processes"""
+    conf = UserConfig('benchconfig', {}, lock=True, merge=merge)
+    for value in range(count):
+        conf.set('process%d' % index, 'option%d' % value, value)
+
+def bench_processes(processes=4, count=100):
+    """Concurrent set(save=True) from several processes (lock/merge)"""
+    try:
+        import multiprocessing
+    except ImportError:
+        return
+    for label, merge in (('lock=True', False), ('merge=True', True)):
+        workers = [ multiprocessing.Process(target=set_in_process,
+                                            args=(index, count, merge))
+                    for index in range(processes) ]
+        start = time.time()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.time()-start
+        conf = UserConfig('benchconfig', {})
+        kept = sum([ len(conf.items(section)) for section in conf.sections()
+                     if section.startswith('process') ])
+        print '%-11s %d processes x %d sets: %8.4f s  (%8.0f sets/s, ' \
+              '%d/%d options kept)' % (label, processes, count, elapsed,
+                                       processes*count/elapsed,
+                                       kept, processes*count)
+        conf.cleanup()
+
+def bench_get_section(options=500, loops=20):
+    """get_section()/get_many() versus a loop of get() calls"""
+    defaults = [('section', dict([ ('option%d' % index, [index, 'text'])
+                                   for index in range(options) ]))]
+    conf = UserConfig('benchconfig', defaults, load=False)
+    names = conf.options('section')
+    keys = [ ('section', option) for option in names ]
+    def get_loop():
+        for option in names:
+            conf.get('section', option)
+    def get_section():
+        conf.get_section('section')
+    def get_many():
+        conf.get_many(keys)
+    for cache in ('cold', 'warm'):
+        for label, func in (('get() loop', get_loop),
+                            ('get_section()', get_section),
+                            ('get_many()', get_many)):
+            def run():
+                for _index in range(loops):
+                    if cache == 'cold':
+                        conf._decoded.clear()
+                    func()
+            elapsed = best_of(run)
+            print '%-4s %-14s %d x %d options: %8.4f s  (%8.3f ms/section)'\
+                  % (cache, label, loops, options, elapsed,
+                     1000*elapsed/loops)
+    conf.cleanup()
+
+def bench_update(options=500):
+    """update() versus a loop of set() calls, with and without saving"""
+    defaults = make_options(1, options)
+    conf = UserConfig('benchconfig', defaults)
+    values = dict([ ('option%d' % index, index+1)
+                    for index in range(options) ])
+    for save in (False, True):
+        def set_loop():
+            for option, value in values.iteritems():
+                conf.set('section0', option, value, save=save)
+            conf.reset_to_defaults(save=save)
+        def update():
+            conf.set_section('section0', values, save=save)
+            conf.reset_to_defaults(save=save)
+        for label, func in (('set() loop', set_loop), ('update()', update)):
+            elapsed = best_of(func)
+            print '%-11s save=%-5s %d options: %8.4f s' % \
+                  (label, save, options, elapsed)
+    conf.cleanup()
+
+def bench_migration(sections=100, options=100):
+    """Version change of a 10k options file: reset to defaults/migrations"""
+    defaults = make_options(sections, options)
+    new_defaults = make_options(sections, options)
+    for section, secdict in new_defaults[:10]:
+        secdict['renamed'] = secdict.pop('option0')
+    migrations = {'1.1.0': [ Rename(section, 'option0', 'renamed')
+                             for section, _secdict in new_defaults[:10] ] +
+                           [ Drop(section, 'option1')
+                             for section, _secdict in new_defaults[10:20] ]}
+    for label, kwargs in (('reset_to_defaults', {}),
+                          ('migrations', dict(migrations=migrations))):
+        def migrate():
+            conf = UserConfig('benchconfig', defaults, version='1.0.0')
+            conf.set('section0', 'option5', -1)
+            start = time.time()
+            UserConfig('benchconfig', new_defaults, version='1.1.0', **kwargs)
+            elapsed = time.time()-start
+            conf.cleanup()
+            return elapsed
+        elapsed = min([ migrate() for _index in range(3) ])
+        print '%-17s %d options: %8.4f s' % (label, sections*options, elapsed)
+
+def make_schema_options(sections, options):
+    """Return defaults made of int and list options (see bench_schema)"""
+    return [ (section, dict([ (option, [value, 'text'] if value % 2
+                               else value)
+                              for option, value in secdict.items() ]))
+             for section, secdict in make_options(sections, options) ]
+
+def measure_schema(schema, sections, options, queue):
+    """
+    Worker of bench_schema: put RSS (kB) of config (and schema) in queue,
+    options being read once
+    """
+    defaults = make_schema_options(sections, options)
+    rss = get_rss()
+    if schema:
+        defaults = Schema(defaults)
+    conf = UserConfig('benchconfig', defaults, load=False)
+    for section, secdict in make_schema_options(sections, options):
+        for option in secdict:
+            conf.get(section, option)
+    queue.put(get_rss()-rss)
+
+def bench_schema(sections=100, options=100):
+    """
+    Memory (measured in a new process) and get/set latency with and
+    without a compiled schema
+    """
+    try:
+        import multiprocessing
+    except ImportError:
+        multiprocessing = None
+    defaults = make_schema_options(sections, options)
+    keys = [ (section, option) for section, secdict in defaults
+             for option in secdict ]
+    for label, make_defaults in (('defaults', lambda: defaults),
+                                 ('schema', lambda: Schema(defaults))):
+        rss = 0
+        if multiprocessing is not None:
+            queue = multiprocessing.Queue()
+            worker = multiprocessing.Process(target=measure_schema,
+                                             args=(label == 'schema',
+                                                   sections, options, queue))
+            worker.start()
+            rss = queue.get()
+            worker.join()
+        conf = UserConfig('benchconfig', make_defaults(), load=False)
+        def get():
+            conf._decoded.clear()
+            for section, option in keys:
+                conf.get(section, option)
+        def set():
+            for section, option in keys:
+                conf.set(section, option, 1, save=False)
+        print '%-8s %d options: %6d kB, get %8.4f s, set %8.4f s' % \
+              (label, len(keys), rss, best_of(get), best_of(set))
+        conf.cleanup()
+
+def bench_snapshot(sections=100, options=50):
+    """Startup time: parsing the .ini file vs cold and warm snapshot cache"""
+    defaults = [ (section, dict([ (option, [value, 'text', (1.5, None)])
+                                  for option, value in secdict.items() ]))
+                 for section, secdict in make_options(sections, options) ]
+    conf = UserConfig('benchconfig', defaults)
+    cache = conf.filename()+'.cache'
+    def load(snapshot_cache):
+        conf = UserConfig('benchconfig', defaults,
+                          snapshot_cache=snapshot_cache)
+        for section, secdict in defaults:
+            conf.get_section(section)
+    def cold():
+        if os.path.isfile(cache):
+            os.remove(cache)
+        load(True)
+    print '%d options: no cache %8.4f s, cold %8.4f s, warm %8.4f s' % \
+          (sections*options, best_of(lambda: load(False)), best_of(cold),
+           best_of(lambda: load(True)))
+    conf.cleanup()
+
+def bench_storage(sections=20, options=50, count=200):
+    """Set (and save) / get throughput of storage backends"""
+    defaults = make_options(sections, options)
+    keys = [ (section, option) for section, secdict in defaults
+             for option in secdict ][:count]
+    for storage in (FileStorage(), MemoryStorage(), SQLiteStorage()):
+        conf = UserConfig('benchconfig', defaults, storage=storage)
+        rounds = [0]
+        def set():
+            # Values have to change on each round to be saved
+            rounds[0] += 1
+            for section, option in keys:
+                conf.set(section, option, rounds[0])
+        def get():
+            conf.reload()
+            for section, option in keys:
+                conf.get(section, option)
+        set_time, get_time = best_of(set), best_of(get)
+        print '%-13s %d options: %6d set/s, %6d get/s (after reload)' % \
+              (storage.__class__.__name__, sections*options,
+               len(keys)/set_time, len(keys)/get_time)
+        conf.cleanup()
+
+def bench_journal(count=200):
+    """Set (and save) latency with and without journal, by config size"""
+    for sections in (1, 10, 100):
+        defaults = make_options(sections, 100)
+        for journal in (False, True):
+            storage = FileStorage(journal=journal)
+            conf = UserConfig('benchconfig', defaults, storage=storage)
+            rounds = [0]
+            def set():
+                rounds[0] += 1
+                for index in xrange(count):
+                    conf.set('section0', 'option0', rounds[0]*count+index)
+            print '%5d options, journal=%-5s: %8.1f us/set' % \
+                  (sections*100, journal, best_of(set)/count*1e6)
+            conf.close()
+            conf.cleanup()
+
+def percentiles(timings, points=(50, 90, 99, 100)):
+    """Return timings percentiles (in microseconds)"""
+    timings = sorted(timings)
+    return [ timings[min(len(timings)-1, len(timings)*point//100)]*1e6
+             for point in points ]
+
+def bench_saver(sections=10, options=100, count=500):
+    """Set latency percentiles with synchronous and background saving"""
+    defaults = make_options(sections, options)
+    for save_delay in (None, 0.05):
+        conf = UserConfig('benchconfig', defaults, fsync=FSYNC_FILE,
+                          save_delay=save_delay)
+        timings = []
+        for value in xrange(count):
+            start = time.time()
+            conf.set('section0', 'option0', value)
+            timings.append(time.time()-start)
+        start = time.time()
+        conf.close()
+        print 'save_delay=%-4s set: p50 %7.1f us, p90 %7.1f us, ' \
+              'p99 %7.1f us, max %7.1f us (close %.4f s)' % \
+              ((save_delay,)+tuple(percentiles(timings))+(time.time()-start,))
+        conf.cleanup()
+
+def bench_async(tasks=100, loops=20, sections=10, options=100):
+    """
+    Concurrent coroutines reading and writing options: UserConfig (saving
+    in the event loop) vs AsyncUserConfig -- requires trollius
+    """
+    if asyncio is None:
+        print 'trollius is not installed'
+        return
+    defaults = make_options(sections, options)
+    for label in ('UserConfig', 'AsyncUserConfig'):
+        loop = asyncio.new_event_loop()
+        if label == 'UserConfig':
+            conf = UserConfig('benchconfig', defaults)
+        else:
+            conf = AsyncUserConfig('benchconfig', defaults, loop=loop)
+            loop.run_until_complete(conf.load())
+        stalls = []
+        @asyncio.coroutine
+        def ticker():
+            # Measure how late the event loop wakes up a sleeping coroutine
+            while True:
+                start = time.time()
+                yield asyncio.From(asyncio.sleep(0.001, loop=loop))
+                stalls.append(time.time()-start-0.001)
+        @asyncio.coroutine
+        def task(index):
+            for value in xrange(loops):
+                conf.get('section%d' % (index % sections), 'option0')
+                conf.set('section%d' % (index % sections),
+                         'option%d' % (index % options), value)
+                if isinstance(conf, AsyncUserConfig) and value % 5 == 0:
+                    yield asyncio.From(conf.save())
+                else:
+                    yield asyncio.From(asyncio.sleep(0, loop=loop))
+        tick = loop.create_task(ticker())
+        start = time.time()
+        loop.run_until_complete(asyncio.wait([ task(index)
+                                               for index in range(tasks) ],
+                                             loop=loop))
+        duration = time.time()-start
+        tick.cancel()
+        if label == 'AsyncUserConfig':
+            loop.run_until_complete(conf.close())
+            conf = conf.config
+        print '%-15s %d tasks: %7d get+set/s, event loop stall: ' \
+              'p50 %7.1f us, max %8.1f us' % \
+              (label, tasks, tasks*loops/duration,
+               percentiles(stalls)[0], percentiles(stalls)[-1])
+        conf.cleanup()
+        loop.close()
+
+def bench_threads(count=20000, write_ratio=20, options=100):
+    """
+    Thread-safe mode contention: get (and 1 set every write_ratio gets)
+    throughput by number of threads sharing a config
+    """
+    defaults = make_options(1, options)
+    for thread_safe in (False, True):
+        conf = UserConfig('benchconfig', defaults, thread_safe=thread_safe)
+        for threads in (1, 2, 4, 8):
+            if not thread_safe and threads > 1:
+                break
+            def run(index):
+                get, set = conf.get, conf.set
+                for value in xrange(count // threads):
+                    option = 'option%d' % (value % options)
+                    if value % write_ratio:
+                        get('section0', option)
+                    else:
+                        set('section%d' % index, option, value, save=False)
+            workers = [ threading.Thread(target=run, args=(index,))
+                        for index in range(threads) ]
+            start = time.time()
+            for worker in workers:
+                worker.start()
+            for worker in workers:
+                worker.join()
+            print 'thread_safe=%-5s %d threads: %8d ops/s' % \
+                  (thread_safe, threads, count/(time.time()-start))
+        conf.cleanup()
+
+def bench_layers(sections=10, options=100, loops=20):
+    """
+    LayeredConfig: get time by number of system files (each defining all
+    options), compared to UserConfig.get, and lookup table rebuild time
+    """
+    defaults = make_options(sections, options)
+    conf = UserConfig('benchconfig', defaults)
+    keys = [ (section, option) for section, secdict in defaults
+             for option in secdict ]
+    def get_all(get):
+        for _index in xrange(loops):
+            for section, option in keys:
+                get(section, option)
+    count = loops*len(keys)
+    elapsed = best_of(lambda: get_all(conf.get))
+    print 'UserConfig.get: %.2f us/get' % (elapsed/count*1e6)
+    home = tempfile.mkdtemp()
+    try:
+        system_files = []
+        for files in (0, 1, 4, 16):
+            while len(system_files) < files:
+                filename = os.path.join(home,
+                                        'system%d.ini' % len(system_files))
+                system = open(filename, 'w')
+                for section, secdict in defaults:
+                    system.write('[%s]\n' % section)
+                    for option in secdict:
+                        system.write('%s = %d\n' % (option, len(system_files)))
+                system.close()
+                system_files.append(filename)
+            layers = LayeredConfig(conf, system_files, environ={})
+            elapsed = best_of(lambda: get_all(layers.get))
+            rebuild = best_of(layers.reload)
+            layers.close()
+            print 'LayeredConfig.get, %2d system files: %.2f us/get, ' \
+                  'reload: %.1f ms' % (files, elapsed/count*1e6, rebuild*1e3)
+    finally:
+        shutil.rmtree(home)
+    conf.cleanup()
+
+def bench_stats(options=100, loops=200):
+    """
+    Instrumentation overhead: get/set time with stats disabled and enabled
+    """
+    defaults = make_options(1, options)
+    conf = UserConfig('benchconfig', defaults)
+    names = ['option%d' % index for index in range(options)]
+    count = loops*options
+    def get_all():
+        for _index in xrange(loops):
+            for option in names:
+                conf.get('section0', option)
+    def set_all():
+        for index in xrange(loops):
+            for option in names:
+                conf.set('section0', option, index, save=False)
+    for enabled in (False, True):
+        if enabled:
+            conf.enable_stats()
+        get_time = best_of(get_all)
+        set_time = best_of(set_all)
+        print 'stats %-8s get: %.2f us, set: %.2f us' % \
+              (enabled and 'enabled' or 'disabled',
+               get_time/count*1e6, set_time/count*1e6)
+    conf.cleanup()
+
+def measure_memory(low_memory, sections, options, queue):
+    """
+    Worker of bench_memory: put RSS (kB) of config and its defaults, and
+    load time in queue
+    """
+    rss = get_rss()
+    defaults = make_options(sections, options)
+    start = time.time()
+    conf = UserConfig('benchconfig', defaults, low_memory=low_memory)
+    elapsed = time.time()-start
+    for section, secdict in defaults:
+        for option in secdict:
+            conf.get(section, option)
+    queue.put( (get_rss()-rss, elapsed) )
+
+def bench_memory(sections=1000, options=100):
+    """
+    Memory used by a large config (options loaded and read once), with
+    and without low_memory (each measured in a new process)
+    """
+    try:
+        import multiprocessing
+    except ImportError:
+        return
+    # The first process creates the .ini file (not measured)
+    for low_memory in (None, False, True):
+        queue = multiprocessing.Queue()
+        worker = multiprocessing.Process(target=measure_memory,
+                                         args=(bool(low_memory), sections,
+                                               options, queue))
+        worker.start()
+        rss, elapsed = queue.get()
+        worker.join()
+        if low_memory is None:
+            continue
+        print 'low_memory=%-5s %d options: %8d kB  (%6d kB per 100k ' \
+              'options), load %.2f s' % (low_memory, sections*options, rss,
+                                         rss*100000/(sections*options),
+                                         elapsed)
+    UserConfig('benchconfig', {}, load=False).cleanup()
+
+def measure_read(streaming, filename, queue):
+    """
+    Worker of bench_stream: put reading time and RSS (kB) in queue
+    """
+    rss = get_rss()
+    start = time.time()
+    if streaming:
+        conf_file = file(filename, 'rb')
+        for _option in iter_options(conf_file):
+            pass
+        conf_file.close()
+    else:
+        RawConfigParser().read(filename)
+    queue.put( (time.time()-start, get_rss()-rss) )
+
+def bench_stream(size=100, options=100):
+    """
+    Streaming parser and writer on a large .ini file (size in MB, with
+    'options' options per section): reading time and memory (ConfigParser
+    vs iter_options, in new processes), and time to save one changed option
+    (whole file written vs patched)
+    """
+    try:
+        import multiprocessing
+    except ImportError:
+        return
+    home = tempfile.mkdtemp()
+    filename = os.path.join(home, 'large.ini')
+    conf_file = file(filename, 'wb')
+    section = 0
+    while conf_file.tell() < size << 20:
+        conf_file.write('[section%d]\n# Comment\n' % section)
+        conf_file.write(''.join([ "option%d = 'value of option %d in "
+                                  "section %d, some text'\n"
+                                  % (option, option, section)
+                                  for option in range(options) ]))
+        conf_file.write('\n')
+        section += 1
+    conf_file.close()
+    try:
+        for label, streaming in (('ConfigParser.read', False),
+                                 ('iter_options', True)):
+            queue = multiprocessing.Queue()
+            worker = multiprocessing.Process(target=measure_read,
+                                             args=(streaming, filename,
+                                                   queue))
+            worker.start()
+            elapsed, rss = queue.get()
+            worker.join()
+            print '%-17s %d MB (%d options): %6.2f s, %8d kB' % \
+                  (label, size, section*options, elapsed, rss)
+        config = RawConfigParser()
+        conf_file = file(filename, 'rb')
+        index = read_config(conf_file, config)
+        conf_file.close()
+        config.set('section0', 'option0', 'changed')
+        output = os.path.join(home, 'output.ini')
+        def write():
+            target = file(output, 'wb')
+            write_config(target, config)
+            target.close()
+        def patch():
+            source, target = file(filename, 'rb'), file(output, 'wb')
+            patch_config(source, target, index, config,
+                         [('section0', 'option0', 'changed')])
+            source.close()
+            target.close()
+        for label, func in (('write_config', write), ('patch_config', patch)):
+            print '%-17s %d MB, 1 option changed: %6.2f s' % \
+                  (label, size, best_of(func))
+    finally:
+        shutil.rmtree(home)
+
+
+if __name__ == "__main__":
+    home = tempfile.mkdtemp()
+    os.environ['HOME'] = home
+    try:
+        bench_batch()
+        bench_get_default()
+        bench_get_cache()
+        bench_get_section()
+        bench_update()
+        bench_migration()
+        bench_schema()
+        bench_codec()
+        bench_startup()
+        bench_snapshot()
+        bench_storage()
+        bench_journal()
+        bench_saver()
+        bench_async()
+        bench_threads()
+        bench_layers()
+        bench_stats()
+        bench_memory()
+        bench_stream()
+        bench_fsync()
+        bench_processes()
+    finally:
+        shutil.rmtree(home)
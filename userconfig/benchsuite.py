@@ -0,0 +1,292 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+userconfig benchmark suite
+==========================
+
+Benchmarks of UserConfig main operations at several config sizes, with
+machine-readable (JSON) results so that runs can be compared:
+
+    python benchsuite.py --output before.json
+    ...
+    python benchsuite.py --output after.json --compare before.json
+
+Configs are created in a temporary home directory (no user file is
+touched); requires the json (or simplejson) module
+"""
+
+from __future__ import with_statement
+
+import os, sys, time, shutil, tempfile
+from optparse import OptionParser
+from timeit import default_timer
+
+from userconfig import UserConfig, __version__
+from codec import json
+
+
+SIZES = (10, 1000, 100000)
+
+# Options per section
+SECTION_SIZE = 100
+
+VALUE_TYPES = ('bool', 'int', 'float', 'str', 'unicode', 'list', 'tuple')
+
+# Minimum number of calls timed by 'get' benchmarks
+MIN_CALLS = 10000
+
+# Number of options set (and saved) by 'set_save' benchmark
+SAVED_SETS = 10
+
+def make_value(vtype, index):
+    """Return a value of type vtype"""
+    if vtype == 'bool':
+        return bool(index % 2)
+    elif vtype == 'int':
+        return index
+    elif vtype == 'float':
+        return index+0.5
+    elif vtype == 'str':
+        return 'text %d' % index
+    elif vtype == 'unicode':
+        # ASCII only: non-ASCII unicode can't be written with the default
+        # encoding of Python 2 (see ConfigParser.write)
+        return u'unicode %d' % index
+    elif vtype == 'list':
+        return [index, 'kk']
+    elif vtype == 'tuple':
+        return (None, index)
+    raise RuntimeError("Unknown value type %r" % vtype)
+
+def make_defaults(size):
+    """
+    Return defaults made of 'size' options, of all value types in turn
+    """
+    defaults = []
+    for index in range(size):
+        if index % SECTION_SIZE == 0:
+            options = {}
+            defaults.append( ('section%d' % (index // SECTION_SIZE),
+                              options) )
+        vtype = VALUE_TYPES[index % len(VALUE_TYPES)]
+        options['%s%d' % (vtype, index)] = make_value(vtype, index)
+    return defaults
+
+def get_type(option):
+    """Return the value type of an option made by 'make_defaults'"""
+    return option.rstrip('0123456789')
+
+def get_keys(defaults, vtype=None):
+    """Return (section, option) of defaults (of type vtype)"""
+    return [ (section, option) for section, options in defaults
+             for option in options
+             if vtype is None or get_type(option) == vtype ]
+
+def best_of(func, repeat, setup=None):
+    """
+    Return the best wall-clock time (in seconds) of 'repeat' calls of func
+    setup: if not None, function called before each call (not timed),
+           func being called with its return value
+    """
+    times = []
+    for _index in range(repeat):
+        if setup is None:
+            start = default_timer()
+            func()
+        else:
+            arg = setup()
+            start = default_timer()
+            func(arg)
+        times.append(default_timer()-start)
+    return min(times)
+
+def result(name, size, operations, seconds):
+    """Return a benchmark result (dictionnary)"""
+    return dict(name=name, options=size, operations=operations,
+                seconds=seconds, us_per_op=seconds/operations*1e6)
+
+def remove_config(name):
+    """Remove config files"""
+    conf = UserConfig(name, {}, load=False)
+    if os.path.isfile(conf.filename()):
+        conf.cleanup()
+
+def bench_constructor(name, defaults, repeat):
+    """Constructor without (cold) and with (warm) existing .ini file"""
+    size = len(get_keys(defaults))
+    create = lambda _arg: UserConfig(name, defaults)
+    elapsed = best_of(create, repeat, lambda: remove_config(name))
+    results = [result('constructor_cold', size, 1, elapsed)]
+    elapsed = best_of(lambda: UserConfig(name, defaults), repeat)
+    results.append(result('constructor_warm', size, 1, elapsed))
+    return results
+
+def bench_get(name, defaults, repeat):
+    """
+    get: first call (value decoded) and next calls (cached), by value type
+    """
+    size = len(get_keys(defaults))
+    results = []
+    for vtype in VALUE_TYPES:
+        keys = get_keys(defaults, vtype)
+        if not keys:
+            continue
+        def get_all(conf):
+            for section, option in keys:
+                conf.get(section, option)
+        elapsed = best_of(get_all, repeat, lambda: UserConfig(name, defaults))
+        results.append(result('get_first_%s' % vtype, size, len(keys),
+                              elapsed))
+        conf = UserConfig(name, defaults)
+        loops = max(1, MIN_CALLS // len(keys))
+        def cached():
+            get = conf.get
+            for _index in xrange(loops):
+                for section, option in keys:
+                    get(section, option)
+        results.append(result('get_%s' % vtype, size, loops*len(keys),
+                              best_of(cached, repeat)))
+    return results
+
+def bench_set(name, defaults, repeat):
+    """
+    set: all options without saving, and a few options saved each time
+    """
+    keys = get_keys(defaults)
+    size = len(keys)
+    conf = UserConfig(name, defaults)
+    values = [0]
+    def set_all():
+        values[0] += 1
+        for section, option in keys:
+            conf.set(section, option, make_value(get_type(option), values[0]),
+                     save=False)
+    results = [result('set_nosave', size, size, best_of(set_all, repeat))]
+    saved_keys = keys[:SAVED_SETS]
+    def set_saved():
+        values[0] += 1
+        for section, option in saved_keys:
+            conf.set(section, option, make_value(get_type(option), values[0]))
+    results.append(result('set_save', size, len(saved_keys),
+                          best_of(set_saved, repeat)))
+    return results
+
+def bench_reset(name, defaults, repeat):
+    """reset_to_defaults (and save) of a config whose options all changed"""
+    keys = get_keys(defaults)
+    conf = UserConfig(name, defaults)
+    def change_all():
+        for section, option in keys:
+            conf.set(section, option, make_value(get_type(option), -1),
+                     save=False)
+    elapsed = best_of(lambda _arg: conf.reset_to_defaults(), repeat,
+                      change_all)
+    return [result('reset_to_defaults', len(keys), len(keys), elapsed)]
+
+def bench_migration(name, defaults, repeat):
+    """
+    Version change: config reset to defaults, deprecated options (a tenth
+    of options, in their own sections) being removed
+    """
+    keys = get_keys(defaults)
+    deprecated = [ ('old_' + section, option)
+                   for section, option in keys[:max(1, len(keys) // 10)] ]
+    def create_old_version():
+        remove_config(name)
+        conf = UserConfig(name, defaults, version='1.0.0')
+        with conf.batch():
+            for section, option in deprecated:
+                conf.set(section, option, 1)
+    upgrade = lambda _arg: UserConfig(name, defaults, version='2.0.0')
+    elapsed = best_of(upgrade, repeat, create_old_version)
+    return [result('migration', len(keys), len(keys), elapsed)]
+
+BENCHMARKS = (bench_constructor, bench_get, bench_set, bench_reset,
+              bench_migration)
+
+def run_suite(sizes=SIZES, repeat=3, verbose=False):
+    """
+    Run benchmarks at each config size: return results document
+    (dictionnary, see module docstring)
+    """
+    home = tempfile.mkdtemp()
+    old_home = os.environ.get('HOME')
+    os.environ['HOME'] = home
+    results = []
+    try:
+        for size in sizes:
+            defaults = make_defaults(size)
+            for benchmark in BENCHMARKS:
+                for entry in benchmark('benchsuite', defaults, repeat):
+                    if verbose:
+                        print >>sys.stderr, '%-20s %7d options: %12.2f us/op' \
+                              % (entry['name'], size, entry['us_per_op'])
+                    results.append(entry)
+            remove_config('benchsuite')
+    finally:
+        if old_home is None:
+            del os.environ['HOME']
+        else:
+            os.environ['HOME'] = old_home
+        shutil.rmtree(home)
+    return dict(userconfig=__version__, python=sys.version.split()[0],
+                platform=sys.platform,
+                date=time.strftime('%Y-%m-%dT%H:%M:%S'), repeat=repeat,
+                results=results)
+
+def compare(document, baseline):
+    """
+    Return comparison lines of two results documents (time ratios:
+    below 1 means faster than baseline)
+    """
+    base = dict([ ((entry['name'], entry['options']), entry['us_per_op'])
+                  for entry in baseline['results'] ])
+    lines = []
+    for entry in document['results']:
+        key = (entry['name'], entry['options'])
+        if key in base and base[key]:
+            lines.append('%-20s %7d options: %12.2f -> %12.2f us/op (x%.2f)'
+                         % (key + (base[key], entry['us_per_op'],
+                                   entry['us_per_op']/base[key])))
+    return lines
+
+def main():
+    """Command line interface"""
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('--sizes', default=','.join(map(str, SIZES)),
+                      help='comma-separated config sizes (number of '
+                           'options), default: %default')
+    parser.add_option('--repeat', type='int', default=3,
+                      help='best of REPEAT runs, default: %default')
+    parser.add_option('--output', help='write JSON results to OUTPUT '
+                                       '(default: standard output)')
+    parser.add_option('--compare', metavar='BASELINE',
+                      help='compare results with a previous JSON output')
+    parser.add_option('--quiet', action='store_true', default=False,
+                      help="don't print progress to standard error")
+    options, _args = parser.parse_args()
+    if json is None:
+        parser.error('the json (or simplejson) module is required')
+    sizes = [ int(size) for size in options.sizes.split(',') ]
+    document = run_suite(sizes, options.repeat, not options.quiet)
+    text = json.dumps(document, indent=1, sort_keys=True)
+    if options.output is None:
+        print text
+    else:
+        output = file(options.output, 'w')
+        try:
+            output.write(text+'\n')
+        finally:
+            output.close()
+    if options.compare is not None:
+        baseline_file = file(options.compare)
+        try:
+            baseline = json.load(baseline_file)
+        finally:
+            baseline_file.close()
+        for line in compare(document, baseline):
+            print >>sys.stderr, line
+
+
+if __name__ == "__main__":
+    main()
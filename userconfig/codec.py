@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+userconfig codecs
+=================
+
+Conversion of option values from/to the strings stored in .ini files
+
+Values are decoded without 'eval': the default codec only accepts Python
+literals (numbers, booleans, None, str/unicode, lists, tuples and dicts)
+"""
+
+import re
+
+try:
+    import json
+except ImportError:
+    try:
+        import simplejson as json
+    except ImportError:
+        json = None
+
+
+_TOKEN = re.compile(r"""\s*(?:
+    (?P<str>[uU]?(?:'(?:[^'\\\n]|\\.)*'|"(?:[^"\\\n]|\\.)*"))
+   |(?P<num>[-+]?(?:\d+\.\d*|\.\d+|\d+)(?:[eE][-+]?\d+)?[lL]?)
+   |(?P<name>[A-Za-z_]\w*)
+   |(?P<op>[][(){},:])
+   |(?P<error>\S)
+    )""", re.VERBOSE)
+
+_NAMES = {'True': True, 'False': False, 'None': None}
+_CLOSING = {'[': ']', '(': ')', '{': '}'}
+# Names (e.g. JSON true, null, NaN) are not parsed by json
+_NAME = re.compile(r'[A-Za-z_]')
+
+def _string(token):
+    """Return the str/unicode value of a string token"""
+    if token[0] in 'uU':
+        body = token[2:-1]
+        if isinstance(body, unicode):
+            if '\\' in body:
+                body = body.encode('ascii', 'backslashreplace'
+                                   ).decode('unicode_escape')
+            return body
+        return body.decode('unicode_escape')
+    body = token[1:-1]
+    if '\\' in body:
+        body = body.decode('string_escape')
+    return body
+
+def _number(token):
+    """Return the int/long/float value of a number token"""
+    if token[-1] in 'lL':
+        return long(token[:-1])
+    try:
+        return int(token)
+    except ValueError:
+        return float(token)
+
+def _scalar(kind, token):
+    """Return the value of a number, string or name token"""
+    if kind == 'num':
+        return _number(token)
+    elif kind == 'str':
+        return _string(token)
+    elif kind == 'name' and token in _NAMES:
+        return _NAMES[token]
+    raise ValueError("Unexpected %r" % token)
+
+def _parse(tokens, index):
+    """Parse the value starting at tokens[index]: return (value, index)"""
+    kind, token = tokens[index]
+    index += 1
+    if token not in _CLOSING or kind != 'op':
+        return _scalar(kind, token), index
+    closing = _CLOSING[token]
+    is_dict = token == '{'
+    items = []
+    append = items.append
+    is_tuple = False
+    while True:
+        kind, item = tokens[index]
+        if item == closing:
+            break
+        # Scalars are converted inline, containers recursively
+        if kind == 'op':
+            item, index = _parse(tokens, index)
+        else:
+            item = _scalar(kind, item)
+            index += 1
+        if is_dict:
+            if tokens[index][1] != ':':
+                raise ValueError("Expected ':'")
+            value, index = _parse(tokens, index+1)
+            item = (item, value)
+        append(item)
+        separator = tokens[index][1]
+        if separator == ',':
+            index += 1
+            is_tuple = True
+        elif separator != closing:
+            raise ValueError("Expected %r" % closing)
+    index += 1
+    if token == '[':
+        return items, index
+    elif is_dict:
+        try:
+            return dict(items), index
+        except TypeError:
+            raise ValueError("Unhashable dictionnary key")
+    elif is_tuple or not items:
+        return tuple(items), index
+    else:
+        # Parenthesized expression, not a tuple
+        return items[0], index
+
+def literal_eval(text):
+    """
+    Safely evaluate a string containing a Python literal (as produced by
+    'repr' for numbers, booleans, None, str/unicode, lists, tuples and dicts)
+    Raise ValueError if text is not such a literal
+    """
+    if text in _NAMES:
+        return _NAMES[text]
+    if text[:1] == '[' and json is not None and '"' not in text and \
+       _NAME.search(text) is None:
+        # Lists of numbers are valid JSON (with the same meaning): the
+        # json module C parser is much faster than the tokenizer below
+        try:
+            return json.loads(text)
+        except ValueError:
+            pass
+    tokens = [ (mobj.lastgroup, mobj.group(mobj.lastgroup))
+               for mobj in _TOKEN.finditer(text) ]
+    if len(tokens) == 1:
+        return _scalar(*tokens[0])
+    elif not tokens:
+        raise ValueError("Empty literal")
+    try:
+        value, index = _parse(tokens, 0)
+    except IndexError:
+        raise ValueError("Unexpected end of literal: %r" % text)
+    if index != len(tokens):
+        raise ValueError("Malformed literal: %r" % text)
+    return value
+
+
+class Codec(object):
+    """
+    Base codec: encode values into .ini strings, decode them back
+    strict: if False, strings which can't be decoded are returned as is
+            (e.g. unquoted strings written by hand in the .ini file)
+    """
+    name = None
+    strict = False
+
+    def encode(self, value):
+        """Return the string representation of value"""
+        raise NotImplementedError
+
+    def decode(self, text):
+        """Return the value represented by text (raise ValueError on error)"""
+        raise NotImplementedError
+
+class BoolCodec(Codec):
+    """Codec of options whose default value is a bool"""
+    name = 'bool'
+    strict = True
+    def encode(self, value):
+        return repr(bool(value))
+    def decode(self, text):
+        return literal_eval(text)
+
+class IntCodec(Codec):
+    """Codec of options whose default value is an int"""
+    name = 'int'
+    strict = True
+    def encode(self, value):
+        return repr(int(value))
+    def decode(self, text):
+        return int(text)
+
+class FloatCodec(Codec):
+    """Codec of options whose default value is a float"""
+    name = 'float'
+    strict = True
+    def encode(self, value):
+        return repr(float(value))
+    def decode(self, text):
+        return float(text)
+
+class LiteralCodec(Codec):
+    """
+    Default codec: values are stored as Python literals ('repr')
+    and parsed back without 'eval'
+    """
+    name = 'literal'
+    def encode(self, value):
+        return repr(value)
+    def decode(self, text):
+        return literal_eval(text)
+
+class JSONCodec(Codec):
+    """
+    JSON codec (requires the json or simplejson module)
+    Note that tuples are decoded as lists and strings as unicode
+    """
+    name = 'json'
+    def __init__(self):
+        if json is None:
+            raise ImportError("JSONCodec requires the json module")
+    def encode(self, value):
+        return json.dumps(value)
+    def decode(self, text):
+        return json.loads(text)
+
+
+BOOL_CODEC, INT_CODEC, FLOAT_CODEC = BoolCodec(), IntCodec(), FloatCodec()
+
+# Typed codec (or None) by default value type: filled on first use
+_TYPED_CODECS = {bool: BOOL_CODEC, int: INT_CODEC, float: FLOAT_CODEC}
+
+def get_typed_codec(default_value):
+    """
+    Return the codec associated to default value type, or None if the
+    option has to be handled by the generic codec (str, list, tuple, ...)
+    """
+    vtype = type(default_value)
+    try:
+        return _TYPED_CODECS[vtype]
+    except KeyError:
+        if isinstance(default_value, bool):
+            codec = BOOL_CODEC
+        elif isinstance(default_value, float):
+            codec = FLOAT_CODEC
+        elif isinstance(default_value, int):
+            codec = INT_CODEC
+        else:
+            codec = None
+        _TYPED_CODECS[vtype] = codec
+        return codec
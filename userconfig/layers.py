@@ -0,0 +1,245 @@
+# -*- coding: utf-8 -*-
+"""
+userconfig layers
+=================
+
+Merged view of configuration layers, from lowest to highest priority:
+    default:     UserConfig defaults
+    system:      site-wide .ini files (e.g. /etc/app_name.ini), read-only
+    user:        UserConfig options (.ini file in user home directory)
+    environment: environment variables (e.g. APP_NAME_FONT__SIZE=12)
+    runtime:     in-process overrides (never saved)
+
+    LAYERS = LayeredConfig(UserConfig('app_name', defaults))
+    LAYERS.override('Font', 'size', 14)
+    print LAYERS.get('Font', 'size'), LAYERS.which('Font', 'size')
+
+Values of all layers are merged into a lookup table, updated whenever
+a layer changes, so that getting an option costs a single dictionnary
+lookup whatever the number of layers
+"""
+
+import os, re
+import os.path as osp
+from ConfigParser import RawConfigParser
+
+from userconfig import NoDefault, MUTABLE_TYPES, copy_value
+
+
+DEFAULT, SYSTEM, USER, ENVIRONMENT, RUNTIME = ('default', 'system', 'user',
+                                               'environment', 'runtime')
+
+ENV_NAME_PATTERN = re.compile(r'[^A-Z0-9]+')
+
+def get_env_name(prefix, section, option):
+    """
+    Return the name of the environment variable overriding an option
+    """
+    return '%s%s__%s' % (prefix, ENV_NAME_PATTERN.sub('_', section.upper()),
+                         ENV_NAME_PATTERN.sub('_', option.upper()))
+
+class LayeredConfig(object):
+    """
+    Layered view of a UserConfig
+    config: UserConfig providing default and user layers (changes made to
+            it are tracked, see UserConfig 'subscribe')
+    system_files: list of site-wide .ini files, by increasing priority
+                  (default: /etc/<name>.ini on posix systems), their values
+                  being decoded as those of the user .ini file
+    env_prefix: prefix of environment variables overriding options
+                (default: '<NAME>_'), e.g. <PREFIX>FONT__SIZE for option
+                'size' of section 'Font' (see 'get_env_name')
+    environ: environment variables dictionnary (default: os.environ)
+
+    As all defaults are written to the user .ini file, user options whose
+    value is the default value are not considered as set by the user:
+    system values apply to them
+    System files and environment variables are only read again (and
+    defaults indexed again) by 'reload'
+    """
+    def __init__(self, config, system_files=None, env_prefix=None,
+                 environ=None):
+        if system_files is None:
+            system_files = []
+            if os.name == 'posix':
+                system_files.append(osp.join('/etc', config.name+'.ini'))
+        if env_prefix is None:
+            env_prefix = ENV_NAME_PATTERN.sub('_', config.name.upper())+'_'
+        if environ is None:
+            environ = os.environ
+        self.config = config
+        self.system_files = system_files
+        self.env_prefix = env_prefix
+        self.environ = environ
+        self._system = {}
+        self._environment = {}
+        self._overrides = {}
+        # (section, option) -> (value, layer)
+        self._table = {}
+        self.reload()
+        config.subscribe('*', '*', self.__option_changed)
+
+    def reload(self):
+        """
+        Read system files and environment variables again and rebuild
+        the lookup table
+        """
+        config = self.config
+        # Getting version loads the config (if created in lazy mode)
+        config.get_version()
+        system = {}
+        for filename in self.system_files:
+            parser = RawConfigParser()
+            parser.optionxform = config.optionxform
+            parser.read(filename)
+            for section in parser.sections():
+                for option, text in parser.items(section):
+                    try:
+                        system[(section, option)] = config.decode(section,
+                                                                  option, text)
+                    except ValueError, error:
+                        print "Warning: ignoring option %r of %s (%s)" % \
+                              (option, filename, error)
+        self._system = system
+        prefix = self.env_prefix
+        self._environment = dict([ (name, text)
+                                   for name, text in self.environ.items()
+                                   if name.startswith(prefix) ])
+        keys = set(system)
+        keys.update(self._overrides)
+        if config.defaults is not None:
+            for section, options in config.defaults:
+                keys.update([ (section, config.optionxform(option))
+                              for option in options ])
+        user = {}
+        for section in config.sections():
+            for option, value in config.get_section(section).iteritems():
+                user[(section, option)] = value
+        keys.update(user)
+        table = {}
+        for key in keys:
+            entry = self.__resolve(key, user.get(key, NoDefault))
+            if entry is not None:
+                table[key] = entry
+        self._table = table
+
+    def __resolve(self, key, user_value):
+        """
+        Private method returning the (value, layer) of the highest priority
+        layer defining an option, or None
+        user_value: value of the option in the user layer (or NoDefault)
+        """
+        if key in self._overrides:
+            return self._overrides[key], RUNTIME
+        section, option = key
+        config = self.config
+        text = self._environment.get(get_env_name(self.env_prefix,
+                                                  section, option))
+        if text is not None:
+            try:
+                return config.decode(section, option, text), ENVIRONMENT
+            except ValueError, error:
+                print "Warning: ignoring environment variable %s (%s)" % \
+                      (get_env_name(self.env_prefix, section, option), error)
+        default = config.get_default(section, option)
+        if user_value is not NoDefault and user_value != default:
+            return user_value, USER
+        if key in self._system:
+            return self._system[key], SYSTEM
+        if default is not NoDefault:
+            return default, DEFAULT
+
+    def __update(self, key, user_value):
+        """
+        Private method updating the lookup table entry of an option
+        """
+        entry = self.__resolve(key, user_value)
+        if entry is None:
+            self._table.pop(key, None)
+        else:
+            self._table[key] = entry
+
+    def __option_changed(self, section, option, old_value, new_value):
+        """
+        Private method called when an option of the user layer changed
+        """
+        self.__update((section, option), new_value)
+
+    def __key(self, section, option):
+        """
+        Private method returning the lookup table key of an option
+        """
+        if section is None:
+            section = self.config.default_section_name
+        elif not isinstance(section, (str, unicode)):
+            raise RuntimeError, "Argument 'section' must be a string"
+        if not isinstance(option, (str, unicode)):
+            raise RuntimeError, "Argument 'option' must be a string"
+        return section, self.config.optionxform(option)
+
+    def get(self, section, option, default=NoDefault):
+        """
+        Get an option from the highest priority layer defining it
+        section=None: attribute a default section name
+        default: value returned if no layer defines the option (if not
+        specified, an exception will be raised)
+        """
+        try:
+            value = self._table[self.__key(section, option)][0]
+        except KeyError:
+            if default is NoDefault:
+                raise RuntimeError("Unknown option %r" % option)
+            return default
+        if type(value) in MUTABLE_TYPES:
+            return copy_value(value)
+        return value
+
+    def which(self, section, option):
+        """
+        Return the name of the layer supplying the value of an option
+        ('default', 'system', 'user', 'environment' or 'runtime')
+        """
+        try:
+            return self._table[self.__key(section, option)][1]
+        except KeyError:
+            raise RuntimeError("Unknown option %r" % option)
+
+    def set(self, section, option, value, save=True):
+        """
+        Set an option in the user layer (see UserConfig 'set'): the value
+        is not used as long as the option is overriden by the environment
+        or at runtime (see 'which')
+        """
+        self.config.set(section, option, value, save=save)
+
+    def override(self, section, option, value):
+        """
+        Override an option at runtime (value is not saved)
+        """
+        key = self.__key(section, option)
+        self._overrides[key] = value
+        self.__update(key, self.__get_user_value(key))
+
+    def remove_override(self, section, option):
+        """
+        Remove a runtime override set with 'override'
+        """
+        key = self.__key(section, option)
+        if self._overrides.pop(key, NoDefault) is not NoDefault:
+            self.__update(key, self.__get_user_value(key))
+
+    def __get_user_value(self, key):
+        """
+        Private method returning the value of an option in the user layer
+        (or NoDefault)
+        """
+        section, option = key
+        if self.config.has_option(section, option):
+            return self.config.get(section, option)
+        return NoDefault
+
+    def close(self):
+        """
+        Stop tracking changes of the user layer
+        """
+        self.config.unsubscribe('*', '*', self.__option_changed)
@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+"""
+userconfig migration steps
+==========================
+
+Declarative steps upgrading a configuration file from a version to the next
+one, keeping user settings (see UserConfig 'migrations' argument):
+
+    migrations = {'1.1.0': [Rename('Font', 'size', 'point_size'),
+                            Drop('Linestyle', 'color')],
+                  '2.0.0': [MoveSection('Linestyle', 'Lines'),
+                            Transform('Lines', 'width', lambda w: int(w))]}
+
+section=None: attribute a default section name
+"""
+
+
+class Rename(object):
+    """
+    Rename an option (and/or move it to another section)
+    """
+    kind = 'rename'
+    __slots__ = ('section', 'option', 'new_option', 'new_section')
+
+    def __init__(self, section, option, new_option=None, new_section=None):
+        self.section = section
+        self.option = option
+        if new_option is None:
+            new_option = option
+        self.new_option = new_option
+        if new_section is None:
+            new_section = section
+        self.new_section = new_section
+
+class MoveSection(object):
+    """
+    Rename a section (its options are merged into new section if it exists)
+    """
+    kind = 'move_section'
+    __slots__ = ('section', 'new_section')
+
+    def __init__(self, section, new_section):
+        self.section = section
+        self.new_section = new_section
+
+class Transform(object):
+    """
+    Replace an option value by function(value)
+    (value being decoded, and result encoded, according to default value)
+    """
+    kind = 'transform'
+    __slots__ = ('section', 'option', 'function')
+
+    def __init__(self, section, option, function):
+        self.section = section
+        self.option = option
+        self.function = function
+
+class Drop(object):
+    """
+    Remove an option (or a whole section if option is None)
+    """
+    kind = 'drop'
+    __slots__ = ('section', 'option')
+
+    def __init__(self, section, option=None):
+        self.section = section
+        self.option = option
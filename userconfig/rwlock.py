@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""
+userconfig reader/writer lock
+=============================
+
+Lock shared by reading threads and exclusive for a writing thread
+(see UserConfig 'thread_safe' argument)
+"""
+
+import threading
+
+try:
+    from thread import get_ident
+except ImportError:
+    from dummy_thread import get_ident
+
+
+class ReadWriteLock(object):
+    """
+    Reentrant reader/writer lock: any number of threads may hold the read
+    lock at the same time, the write lock being exclusive
+    Writers have priority over threads which don't hold the lock yet
+    The thread holding the write lock may acquire the read lock too, but
+    a thread holding the read lock can't acquire the write lock (upgrading
+    is not supported: RuntimeError is raised instead of deadlocking)
+    """
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = {}
+        self._writer = None
+        self._writes = 0
+        self._waiting_writers = 0
+
+    def acquire_read(self):
+        """Acquire the read lock (blocking)"""
+        ident = get_ident()
+        condition = self._condition
+        condition.acquire()
+        try:
+            if self._writer != ident and ident not in self._readers:
+                while self._writer is not None or self._waiting_writers:
+                    condition.wait()
+            self._readers[ident] = self._readers.get(ident, 0)+1
+        finally:
+            condition.release()
+
+    def release_read(self):
+        """Release the read lock"""
+        ident = get_ident()
+        condition = self._condition
+        condition.acquire()
+        try:
+            count = self._readers[ident]-1
+            if count:
+                self._readers[ident] = count
+            else:
+                del self._readers[ident]
+                if not self._readers:
+                    condition.notifyAll()
+        finally:
+            condition.release()
+
+    def acquire_write(self):
+        """Acquire the write lock (blocking)"""
+        ident = get_ident()
+        condition = self._condition
+        condition.acquire()
+        try:
+            if self._writer == ident:
+                self._writes += 1
+                return
+            if ident in self._readers:
+                raise RuntimeError("Read lock can't be upgraded to write lock")
+            self._waiting_writers += 1
+            try:
+                while self._writer is not None or self._readers:
+                    condition.wait()
+            finally:
+                self._waiting_writers -= 1
+            self._writer = ident
+            self._writes = 1
+        finally:
+            condition.release()
+
+    def is_writer(self):
+        """Return True if the calling thread holds the write lock"""
+        return self._writer == get_ident()
+
+    def is_reader(self):
+        """Return True if the calling thread holds the read lock"""
+        return get_ident() in self._readers
+
+    def release_write(self):
+        """Release the write lock"""
+        condition = self._condition
+        condition.acquire()
+        try:
+            if self._writer != get_ident():
+                raise RuntimeError("Write lock is not held by this thread")
+            self._writes -= 1
+            if not self._writes:
+                self._writer = None
+                condition.notifyAll()
+        finally:
+            condition.release()
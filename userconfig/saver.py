@@ -0,0 +1,158 @@
+# -*- coding: utf-8 -*-
+"""
+userconfig background saver
+===========================
+
+Thread writing config snapshots to storage after a delay, so that setting
+options does not wait for the file to be written (see UserConfig
+'save_delay' argument): snapshots submitted meanwhile are coalesced,
+the last one being written with all their changes
+"""
+
+import time, threading
+
+
+class Saver(object):
+    """
+    Background saver
+    save: function called as save(snapshot, changes) from the saver thread
+          (changes: None or list of changes, see 'storage' module)
+    delay: time (in seconds) between the first submitted snapshot and
+           the time it is written
+    """
+    def __init__(self, save, delay):
+        self.save = save
+        self.delay = delay
+        self.error = None
+        self._condition = threading.Condition()
+        self._snapshot = self._changes = None
+        self._deadline = 0
+        self._pending = False
+        self._writing = False
+        self._flushing = 0
+        self._failed = False
+        self._stopped = False
+        self._thread = threading.Thread(target=self.__run,
+                                        name='userconfig saver')
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def submit(self, snapshot, changes):
+        """Schedule snapshot saving"""
+        condition = self._condition
+        condition.acquire()
+        try:
+            if self._stopped:
+                raise RuntimeError("Saver has been stopped")
+            self.__add(snapshot, changes)
+            self._failed = False
+            condition.notifyAll()
+        finally:
+            condition.release()
+
+    def __add(self, snapshot, changes):
+        """
+        Private method merging snapshot (and changes) with pending ones
+        (called while holding the condition lock)
+        """
+        if not self._pending:
+            self._deadline = time.time()+self.delay
+            if changes is not None:
+                changes = list(changes)
+            self._changes = changes
+        elif changes is None or self._changes is None:
+            self._changes = None
+        else:
+            self._changes.extend(changes)
+        if snapshot is not None:
+            self._snapshot = snapshot
+        self._pending = True
+
+    def is_pending(self):
+        """Return True if a snapshot has not been written yet"""
+        return self._pending or self._writing
+
+    def __run(self):
+        """Saver thread main loop"""
+        condition = self._condition
+        condition.acquire()
+        try:
+            while True:
+                # After a failure, wait for another submit (or flush)
+                while not self._stopped and (not self._pending or
+                                             self._failed):
+                    condition.wait()
+                if not self._pending or self._failed:
+                    # Stopped
+                    break
+                # Wait for more changes to be submitted (unless flushing)
+                while not (self._flushing or self._stopped):
+                    timeout = self._deadline-time.time()
+                    if timeout <= 0:
+                        break
+                    condition.wait(timeout)
+                snapshot, changes = self._snapshot, self._changes
+                self._snapshot = self._changes = None
+                self._pending = False
+                self._writing = True
+                condition.release()
+                try:
+                    try:
+                        self.save(snapshot, changes)
+                        error = None
+                    except Exception, error:
+                        pass
+                finally:
+                    condition.acquire()
+                    self._writing = False
+                if error is not None:
+                    # Keep changes which could not be written: they are
+                    # written again with the next snapshot (or flush)
+                    self.error = error
+                    newer = None
+                    if self._pending:
+                        newer = (self._snapshot, self._changes)
+                        self._pending = False
+                    self.__add(snapshot, changes)
+                    if newer is not None:
+                        self.__add(*newer)
+                    self._failed = True
+                condition.notifyAll()
+        finally:
+            condition.release()
+
+    def flush(self):
+        """
+        Write pending snapshot now and wait until it is written
+        Raise the exception raised while writing it, if any
+        """
+        condition = self._condition
+        condition.acquire()
+        try:
+            self._flushing += 1
+            self._failed = False
+            condition.notifyAll()
+            try:
+                while self._writing or self._pending and not self._failed:
+                    condition.wait()
+            finally:
+                self._flushing -= 1
+            if self._failed:
+                raise self.error
+        finally:
+            condition.release()
+
+    def stop(self):
+        """Write pending snapshot and stop saver thread"""
+        try:
+            self.flush()
+        finally:
+            condition = self._condition
+            condition.acquire()
+            try:
+                self._stopped = True
+                condition.notifyAll()
+            finally:
+                condition.release()
+            if self._thread is not threading.currentThread():
+                self._thread.join()
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+"""
+userconfig schema
+=================
+
+Defaults compiled once into per-option descriptors, so that UserConfig
+does not have to inspect default values types on every get/set call:
+
+    SCHEMA = Schema([('Font', {'size': 10, 'family': 'Arial'})],
+                    validators={('Font', 'size'): check_positive})
+    CONFIG = UserConfig('app_name', SCHEMA)
+    CONFIG.Font.size = 12
+    print CONFIG.Font.size
+"""
+
+from codec import LiteralCodec, get_typed_codec
+
+
+class OptionSpec(object):
+    """
+    Compiled option: type, codec, default value and validator
+    validator: None or function raising ValueError if a value is invalid
+    """
+    __slots__ = ('section', 'option', 'type', 'codec', 'default', 'validator')
+
+    def __init__(self, section, option, default, codec, validator=None):
+        self.section = section
+        self.option = option
+        self.type = type(default)
+        self.codec = codec
+        self.default = default
+        self.validator = validator
+
+    def __repr__(self):
+        return '<OptionSpec %s/%s (%s)>' % (self.section, self.option,
+                                             self.type.__name__)
+
+class Schema(object):
+    """
+    Compiled defaults
+    defaults: dictionnary containing options
+              *or* list of tuples (section_name, options)
+    validators: dictionnary {(section, option): validator}
+    codec: codec used for options which are neither bool, int nor float
+    """
+    default_section_name = 'main'
+
+    def __init__(self, defaults, validators=None, codec=None):
+        if isinstance(defaults, dict):
+            defaults = [ (self.default_section_name, defaults) ]
+        if validators is None:
+            validators = {}
+        if codec is None:
+            codec = LiteralCodec()
+        self.defaults = defaults
+        self.codec = codec
+        # (section, option) -> OptionSpec, with option names transformed
+        # as ConfigParser does (see optionxform)
+        self.specs = {}
+        self.sections = {}
+        for section, options in defaults:
+            secspecs = self.sections.setdefault(section, {})
+            for option, default in options.items():
+                key = (section, option.lower())
+                if key in self.specs:
+                    continue
+                spec = OptionSpec(section, option, default,
+                                  get_typed_codec(default) or codec,
+                                  validators.get((section, option)))
+                self.specs[key] = secspecs[option.lower()] = spec
+
+    def __len__(self):
+        return len(self.specs)
+
+class SectionProxy(object):
+    """
+    Attribute-style access to the options of a config section
+    (returned by UserConfig attributes named after schema sections)
+    """
+    __slots__ = ('_config', '_section')
+
+    def __init__(self, config, section):
+        object.__setattr__(self, '_config', config)
+        object.__setattr__(self, '_section', section)
+
+    def __getattr__(self, option):
+        try:
+            return self._config.get(self._section, option)
+        except RuntimeError, error:
+            raise AttributeError(str(error))
+
+    def __setattr__(self, option, value):
+        self._config.set(self._section, option, value)
+
+    def __dir__(self):
+        return sorted(self._config.schema.sections[self._section])
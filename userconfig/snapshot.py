@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+userconfig snapshot cache
+=========================
+
+Binary cache of a parsed .ini file, with already decoded option values,
+stored next to it (see UserConfig 'snapshot_cache' argument)
+
+The cache is only used if the .ini file modification time, size and SHA-1
+hash match those recorded in the cache. Values are stored in a simple
+tag-length-value format (neither marshal nor pickle is used, so that
+loading a cache can't execute code):
+    N None, T True, F False, I int (64 bits), L long (decimal string),
+    f float, s str, u unicode (UTF-8), l list, t tuple, d dict
+"""
+
+import struct
+
+try:
+    from hashlib import sha1
+except ImportError:
+    from sha import new as sha1
+
+MAGIC = 'UCS1'
+_HEADER = struct.Struct('<4sdQ20sI')
+_INT = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+_LENGTH = struct.Struct('<I')
+_INT_MIN, _INT_MAX = -2**63, 2**63-1
+
+
+class NoValue:
+    """Entry without decoded value"""
+    pass
+
+def get_signature(data, mtime):
+    """Return the (mtime, size, sha1 digest) signature of .ini file data"""
+    return mtime, len(data), sha1(data).digest()
+
+def _dump_value(value, chunks):
+    """Append binary representation of value to chunks"""
+    vtype = type(value)
+    if value is None:
+        chunks.append('N')
+    elif vtype is bool:
+        chunks.append(value and 'T' or 'F')
+    elif vtype is int and _INT_MIN <= value <= _INT_MAX:
+        chunks.append('I' + _INT.pack(value))
+    elif vtype in (int, long):
+        text = str(value)
+        chunks.append('L' + _LENGTH.pack(len(text)) + text)
+    elif vtype is float:
+        chunks.append('f' + _FLOAT.pack(value))
+    elif vtype is str:
+        chunks.append('s' + _LENGTH.pack(len(value)) + value)
+    elif vtype is unicode:
+        text = value.encode('utf-8')
+        chunks.append('u' + _LENGTH.pack(len(text)) + text)
+    elif vtype in (list, tuple):
+        chunks.append((vtype is list and 'l' or 't') + _LENGTH.pack(len(value)))
+        for item in value:
+            _dump_value(item, chunks)
+    elif vtype is dict:
+        chunks.append('d' + _LENGTH.pack(len(value)))
+        for key, item in value.iteritems():
+            _dump_value(key, chunks)
+            _dump_value(item, chunks)
+    else:
+        raise ValueError("Unsupported type %r" % vtype)
+
+def _load_value(data, pos):
+    """Read value at data[pos]: return (value, next position)"""
+    tag = data[pos]
+    pos += 1
+    if tag == 'N':
+        return None, pos
+    elif tag == 'T':
+        return True, pos
+    elif tag == 'F':
+        return False, pos
+    elif tag == 'I':
+        return _INT.unpack_from(data, pos)[0], pos+_INT.size
+    elif tag == 'f':
+        return _FLOAT.unpack_from(data, pos)[0], pos+_FLOAT.size
+    length = _LENGTH.unpack_from(data, pos)[0]
+    pos += _LENGTH.size
+    if tag == 's':
+        return data[pos:pos+length], pos+length
+    elif tag == 'u':
+        return data[pos:pos+length].decode('utf-8'), pos+length
+    elif tag == 'L':
+        return long(data[pos:pos+length]), pos+length
+    elif tag in 'lt':
+        items = []
+        for _index in xrange(length):
+            item, pos = _load_value(data, pos)
+            items.append(item)
+        if tag == 't':
+            items = tuple(items)
+        return items, pos
+    elif tag == 'd':
+        items = {}
+        for _index in xrange(length):
+            key, pos = _load_value(data, pos)
+            items[key], pos = _load_value(data, pos)
+        return items, pos
+    raise ValueError("Unknown tag %r" % tag)
+
+def dump_snapshot(filename, signature, entries):
+    """
+    Write snapshot cache file
+    signature: .ini file signature (see get_signature)
+    entries: list of (section, option, raw value, codec name, decoded value)
+             decoded value being NoValue if it is not cached
+    """
+    chunks = [_HEADER.pack(MAGIC, signature[0], signature[1], signature[2],
+                           len(entries))]
+    for section, option, raw, codec_name, value in entries:
+        for item in (section, option, raw, codec_name):
+            _dump_value(item, chunks)
+        if value is NoValue:
+            chunks.append('N')
+            continue
+        try:
+            value_chunks = ['Y']
+            _dump_value(value, value_chunks)
+        except ValueError:
+            chunks.append('N')
+        else:
+            chunks.extend(value_chunks)
+    cache_file = file(filename, 'wb')
+    try:
+        cache_file.write(''.join(chunks))
+    finally:
+        cache_file.close()
+
+def load_snapshot(filename, signature):
+    """
+    Read snapshot cache file: return the list of entries (see dump_snapshot),
+    or None if cache does not exist, is invalid or does not match signature
+    """
+    try:
+        cache_file = file(filename, 'rb')
+        try:
+            data = cache_file.read()
+        finally:
+            cache_file.close()
+    except IOError:
+        return
+    try:
+        magic, mtime, size, digest, count = _HEADER.unpack_from(data, 0)
+        if (magic, mtime, size, digest) != (MAGIC,)+tuple(signature):
+            return
+        pos = _HEADER.size
+        entries = []
+        for _index in xrange(count):
+            section, pos = _load_value(data, pos)
+            option, pos = _load_value(data, pos)
+            raw, pos = _load_value(data, pos)
+            codec_name, pos = _load_value(data, pos)
+            value = NoValue
+            if data[pos] == 'Y':
+                value, pos = _load_value(data, pos+1)
+            else:
+                pos += 1
+            entries.append( (section, option, raw, codec_name, value) )
+    except (struct.error, IndexError, ValueError, UnicodeDecodeError):
+        return
+    return entries
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+"""
+userconfig statistics
+=====================
+
+Counters and latency histograms of a UserConfig (see UserConfig
+'enable_stats' and 'stats' methods):
+
+    CONFIG.enable_stats()
+    ...
+    stats = CONFIG.stats()
+    print stats['reads'], stats['latency']['get']['p99']
+
+Nothing is measured until stats are enabled: 'get' and 'set' are then
+replaced by timed versions on the config instance only, so that configs
+without stats don't pay for instrumentation
+"""
+
+import math
+from timeit import default_timer
+
+
+class Histogram(object):
+    """
+    Latency histogram: event counts by power of 2 buckets of microseconds
+    (bucket n counts events which took less than 2**n us)
+    """
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.
+
+    def add(self, elapsed):
+        """Add an event which took 'elapsed' seconds"""
+        bucket = math.frexp(elapsed*1e6)[1]
+        self.buckets[bucket] = self.buckets.get(bucket, 0)+1
+        self.count += 1
+        self.total += elapsed
+
+    def percentile(self, percent):
+        """
+        Return the upper bound (in seconds) of the bucket containing the
+        given percentile (None if no event has been added)
+        """
+        threshold = self.count*percent/100.
+        count = 0
+        for bucket in sorted(self.buckets):
+            count += self.buckets[bucket]
+            if count >= threshold:
+                return 2**bucket*1e-6
+
+    def snapshot(self):
+        """
+        Return a dictionnary: 'count', 'total' (seconds), 'p50', 'p90',
+        'p99' (seconds, see 'percentile') and 'buckets' (upper bound in
+        microseconds -> count)
+        """
+        return dict(count=self.count, total=self.total,
+                    p50=self.percentile(50), p90=self.percentile(90),
+                    p99=self.percentile(99),
+                    buckets=dict([ (2**bucket, count) for bucket, count
+                                   in self.buckets.iteritems() ]))
+
+class Stats(object):
+    """
+    UserConfig statistics
+    sink: function called as sink(event, key, elapsed, size) on each
+          measured event: 'get' and 'set' (key: (section, option)),
+          'load' and 'save' (key: None, size: bytes written for 'save',
+          None if unknown), 'decode_error' (key: (section, option),
+          elapsed: None)
+    Counters are not locked: increments made at the same time by several
+    threads (see UserConfig 'thread_safe' argument) may be lost
+    """
+    timed_events = ('get', 'set', 'load', 'save')
+
+    def __init__(self, sink=None):
+        self.sink = sink
+        self.reset()
+
+    def reset(self):
+        """Reset counters and histograms"""
+        self.reads = {}
+        self.writes = {}
+        self.decode_failures = {}
+        self.loads = self.saves = self.bytes_written = 0
+        self.latency = dict([ (event, Histogram())
+                              for event in self.timed_events ])
+
+    def read(self, key, elapsed=None):
+        """Count an option read ('get' event if elapsed is not None)"""
+        self.reads[key] = self.reads.get(key, 0)+1
+        if elapsed is not None:
+            self.latency['get'].add(elapsed)
+            if self.sink is not None:
+                self.sink('get', key, elapsed, None)
+
+    def write(self, key):
+        """Count an option write (changed value)"""
+        self.writes[key] = self.writes.get(key, 0)+1
+
+    def set(self, key, elapsed):
+        """Record a 'set' event"""
+        self.latency['set'].add(elapsed)
+        if self.sink is not None:
+            self.sink('set', key, elapsed, None)
+
+    def decode_failed(self, key):
+        """Count a value which could not be decoded (kept as a string)"""
+        self.decode_failures[key] = self.decode_failures.get(key, 0)+1
+        if self.sink is not None:
+            self.sink('decode_error', key, None, None)
+
+    def loaded(self, elapsed):
+        """Record a 'load' event"""
+        self.loads += 1
+        self.latency['load'].add(elapsed)
+        if self.sink is not None:
+            self.sink('load', None, elapsed, None)
+
+    def saved(self, elapsed, size):
+        """
+        Record a 'save' event (size: bytes written, None if unknown)
+        """
+        self.saves += 1
+        if size is not None:
+            self.bytes_written += size
+        self.latency['save'].add(elapsed)
+        if self.sink is not None:
+            self.sink('save', None, elapsed, size)
+
+    def snapshot(self):
+        """
+        Return a copy of statistics: dictionnary with 'reads', 'writes'
+        and 'decode_failures' ((section, option) -> count), 'loads',
+        'saves', 'bytes_written' and 'latency' (event -> histogram
+        snapshot, see Histogram.snapshot) keys
+        """
+        return dict(reads=self.reads.copy(), writes=self.writes.copy(),
+                    decode_failures=self.decode_failures.copy(),
+                    loads=self.loads, saves=self.saves,
+                    bytes_written=self.bytes_written,
+                    latency=dict([ (event, histogram.snapshot())
+                                   for event, histogram
+                                   in self.latency.iteritems() ]))
@@ -0,0 +1,558 @@
+# -*- coding: utf-8 -*-
+"""
+userconfig storage backends
+===========================
+
+Where UserConfig options are stored (see UserConfig 'storage' argument):
+    FileStorage: .ini file (default: '.<name>.ini' in user home directory),
+                 optionally with a journal of changes appended on each save,
+                 or patched on each save (see 'stream' module)
+    MemoryStorage: in-memory options (tests, ephemeral processes...)
+    SQLiteStorage: SQLite database, changed options being updated one by one
+                   instead of rewriting the whole config on each save
+
+Storage methods 'load' and 'save' read/write options of a UserConfig
+instance; 'save' changes argument is either None (whole config has to be
+written) or a list of (section, option, value) tuples, in order:
+option=None for a removed (value=None) or added (value='', the section
+being empty or not) section, value=None for a removed option;
+'save' returns the number of bytes written (None if unknown)
+"""
+
+import os, tempfile
+import os.path as osp
+from ConfigParser import DEFAULTSECT
+
+from stream import read_config, write_config, patch_config
+
+try:
+    import sqlite3
+except ImportError:
+    sqlite3 = None
+
+
+def get_home_dir():
+    """
+    Return user home directory
+    """
+    try:
+        path = osp.expanduser('~')
+    except:
+        path = ''
+    for env_var in ('HOME', 'USERPROFILE', 'TMP'):
+        if osp.isdir(path):
+            break
+        path = os.environ.get(env_var, '')
+    if path:
+        return path
+    else:
+        raise RuntimeError('Please define environment variable $HOME')
+
+def get_umask():
+    """
+    Return current process umask
+    """
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+def replace_file(src, dst):
+    """
+    Rename src to dst, replacing dst if it already exists
+    (atomic on POSIX systems; on Windows, dst has to be removed first)
+    """
+    if os.name == 'nt' and osp.exists(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+def fsync_dir(dirname):
+    """
+    Flush directory entries to disk (e.g. after a rename) -- POSIX only
+    """
+    if os.name != 'posix':
+        return
+    fd = os.open(dirname, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+FSYNC_NONE, FSYNC_FILE, FSYNC_DIR = 'none', 'file', 'dir'
+
+
+def _escape(text):
+    """Escape text for a journal record (no tab nor newline left)"""
+    if isinstance(text, unicode):
+        text = text.encode('utf-8')
+    return text.encode('string_escape')
+
+def _unescape(text):
+    """Return text escaped by _escape"""
+    return text.decode('string_escape')
+
+def stat_file(filename):
+    """
+    Return (modification time, size, inode) of a file (None if missing)
+    """
+    try:
+        stat = os.stat(filename)
+    except OSError:
+        return
+    return stat.st_mtime, stat.st_size, stat.st_ino
+
+def set_options(config, sections):
+    """
+    Add options {section: {option: value}} to config
+    """
+    for section, options in sections.iteritems():
+        if section == DEFAULTSECT:
+            config._defaults.update(options)
+            continue
+        secdict = config._sections.get(section)
+        if secdict is None:
+            secdict = config._sections[section] = config._dict()
+            secdict['__name__'] = section
+        secdict.update(options)
+
+def remove_options(config, section, option=None):
+    """
+    Remove an option (or a whole section if option is None) from config
+    """
+    if section == DEFAULTSECT:
+        options = config._defaults
+    else:
+        options = config._sections.get(section)
+    if options is None:
+        return
+    if option is None:
+        if section == DEFAULTSECT:
+            options.clear()
+        else:
+            del config._sections[section]
+    else:
+        options.pop(option, None)
+
+def get_options(config):
+    """
+    Return config options as a list of (section, option, value)
+    """
+    rows = [ (DEFAULTSECT, option, value)
+             for option, value in config._defaults.iteritems() ]
+    for section, options in config._sections.iteritems():
+        for option, value in options.iteritems():
+            if option != '__name__':
+                rows.append( (section, option, value) )
+    return rows
+
+
+class Storage(object):
+    """
+    Base storage backend
+    filename: path of the stored data (None if not stored in a file)
+    incremental: if True, 'save' is given the list of changed options
+    compactable: if True, 'compact' writes the whole config
+    """
+    filename = None
+    incremental = False
+    compactable = False
+
+    def attach(self, name):
+        """Associate storage with config name (called by UserConfig)"""
+        pass
+
+    def load(self, config):
+        """
+        Add stored options to config: return False if nothing is stored
+        """
+        raise NotImplementedError
+
+    def save(self, config, changes):
+        """
+        Store config options (see module docstring for changes): return
+        the number of bytes written (None if unknown)
+        """
+        raise NotImplementedError
+
+    def stat(self):
+        """
+        Return a value which changes when stored options are modified
+        (see UserConfig 'auto_reload' argument)
+        """
+        return
+
+    def compact(self, config):
+        """
+        Rewrite stored options in a compact form (e.g. apply journal):
+        return True if the whole config has been written
+        """
+        return False
+
+    def close(self):
+        """Release resources (e.g. database connection)"""
+        pass
+
+    def remove(self):
+        """Remove stored options"""
+        raise NotImplementedError
+
+class FileStorage(Storage):
+    """
+    .ini file storage
+    filename: default is '.<name>.ini' in user home directory (home
+              directory is looked up once, when attached to the config)
+    The file is replaced atomically: see UserConfig 'fsync' argument
+    journal: if True, saving only appends changed options to a '.journal'
+             file (replayed over the .ini file when loading), so that
+             saving costs the same whatever the config size; the journal
+             is written back into the .ini file (compacted) when it grows
+             larger than journal_size bytes, or when calling UserConfig
+             'compact' or 'close' methods
+    streaming: if True, the .ini file is read one line at a time, and
+               saving only rewrites changed options: unchanged sections are
+               copied as is, so that comments are kept (see 'stream'
+               module); the whole file is written again when it has been
+               modified since it was loaded or saved
+               (streaming and journal modes are exclusive)
+    """
+    # Journal records: one line per change, fields being escaped (see
+    # _escape) and followed by a tab, the first field being one of these
+    # operations (a record without its final tab is incomplete)
+    JOURNAL_SET, JOURNAL_REMOVE, JOURNAL_REMOVE_SECTION = '=', '-', '!'
+    JOURNAL_ADD_SECTION = '+'
+
+    def __init__(self, filename=None, journal=False, journal_size=65536,
+                 streaming=False):
+        if journal and streaming:
+            raise RuntimeError("Journal and streaming modes are exclusive")
+        self.filename = filename
+        self.journal = journal
+        self.journal_size = journal_size
+        self.streaming = streaming
+        self.incremental = journal or streaming
+        self.compactable = journal
+        # Streaming mode: index of the .ini file (see 'stream' module), and
+        # file state when indexed
+        self._index = self._indexed_stat = None
+
+    def attach(self, name):
+        if self.filename is None:
+            self.filename = osp.join(get_home_dir(), '.%s.ini' % name)
+
+    def journal_filename(self):
+        """Return journal filename"""
+        return self.filename+'.journal'
+
+    def load(self, config):
+        if self.streaming:
+            return self.__read_streaming(config)
+        exists = bool(config.read(self.filename))
+        if self.journal:
+            exists = self.__replay(config) or exists
+        return exists
+
+    def __read_streaming(self, config):
+        """
+        Private method reading the .ini file one line at a time (and
+        indexing it): return False if it does not exist
+        """
+        self._index = None
+        try:
+            conf_file = file(self.filename, 'rb')
+        except IOError:
+            return False
+        try:
+            stat = os.fstat(conf_file.fileno())
+            self._index = read_config(conf_file, config)
+        finally:
+            conf_file.close()
+        self._indexed_stat = stat.st_mtime, stat.st_size, stat.st_ino
+        return True
+
+    def __replay(self, config):
+        """
+        Private method applying journal records to config
+        Return True if the journal exists
+        """
+        try:
+            journal_file = file(self.journal_filename(), 'rb')
+        except IOError:
+            return False
+        try:
+            for line in journal_file:
+                if not line.endswith('\t\n'):
+                    # Record interrupted while being written
+                    continue
+                fields = [_unescape(field)
+                          for field in line[:-2].split('\t')]
+                operation, section = fields[:2]
+                if operation == self.JOURNAL_SET and len(fields) == 4:
+                    set_options(config, {section: {fields[2]: fields[3]}})
+                elif operation == self.JOURNAL_REMOVE and len(fields) == 3:
+                    remove_options(config, section, fields[2])
+                elif operation == self.JOURNAL_REMOVE_SECTION:
+                    remove_options(config, section)
+                elif operation == self.JOURNAL_ADD_SECTION:
+                    set_options(config, {section: {}})
+        finally:
+            journal_file.close()
+        return True
+
+    def save(self, config, changes):
+        if changes is None:
+            return self.__write(config)
+        if self.streaming:
+            if self._index is None or \
+               stat_file(self.filename) != self._indexed_stat:
+                # File is unknown (or has been modified): rewritten
+                return self.__write(config)
+            return self.__write(config, changes)
+        lines = []
+        for section, option, value in changes:
+            if option is None and value is None:
+                fields = (self.JOURNAL_REMOVE_SECTION, section)
+            elif option is None:
+                fields = (self.JOURNAL_ADD_SECTION, section)
+            elif value is None:
+                fields = (self.JOURNAL_REMOVE, section, option)
+            else:
+                fields = (self.JOURNAL_SET, section, option, value)
+            lines.append('\t'.join([_escape(field) for field in fields]))
+        data = ''.join([line+'\t\n' for line in lines])
+        journal_file = file(self.journal_filename(), 'a+b')
+        try:
+            journal_file.seek(0, 2)
+            if journal_file.tell():
+                journal_file.seek(-1, 2)
+                if journal_file.read(1) != '\n':
+                    # Isolate the record interrupted while being written
+                    data = '\n'+data
+                journal_file.seek(0, 2)
+            journal_file.write(data)
+            if config.fsync != FSYNC_NONE:
+                journal_file.flush()
+                os.fsync(journal_file.fileno())
+            size = journal_file.tell()
+        finally:
+            journal_file.close()
+        if size > self.journal_size:
+            return len(data)+self.__write(config)
+        return len(data)
+
+    def __write(self, config, changes=None):
+        """
+        Private method writing config into the .ini file (atomically)
+        and removing the journal, which has then been applied
+        changes: changes since the file was indexed (streaming mode), the
+                 file being patched (None: whole file written)
+        Return the size of the .ini file
+        """
+        # A symbolic link is kept: the file it points to is replaced
+        filename = osp.realpath(self.filename)
+        dirname, basename = osp.split(filename)
+        if osp.isfile(filename):
+            mode = os.stat(filename).st_mode & 0777
+        else:
+            mode = 0666 & ~get_umask()
+        fd, tmpname = tempfile.mkstemp(prefix=basename+'.', suffix='.tmp',
+                                       dir=dirname)
+        try:
+            if self.streaming:
+                conf_file = os.fdopen(fd, 'wb')
+            else:
+                conf_file = os.fdopen(fd, 'w')
+            try:
+                if not self.streaming:
+                    config.write(conf_file)
+                elif changes is None:
+                    index = write_config(conf_file, config)
+                else:
+                    source = file(filename, 'rb')
+                    try:
+                        index = patch_config(source, conf_file, self._index,
+                                             config, changes)
+                    finally:
+                        source.close()
+                size = conf_file.tell()
+                if config.fsync != FSYNC_NONE:
+                    conf_file.flush()
+                    os.fsync(conf_file.fileno())
+            finally:
+                conf_file.close()
+            os.chmod(tmpname, mode)
+            replace_file(tmpname, filename)
+        except:
+            if osp.exists(tmpname):
+                os.remove(tmpname)
+            self._index = None
+            raise
+        if self.streaming:
+            self._index = index
+            self._indexed_stat = stat_file(filename)
+        if self.journal and osp.isfile(self.journal_filename()):
+            # Replaying the journal over the new .ini file would not
+            # change anything: removing it is safe at any time
+            os.remove(self.journal_filename())
+        if config.fsync == FSYNC_DIR:
+            fsync_dir(dirname)
+        return size
+
+    def stat(self):
+        if self.journal:
+            return (stat_file(self.filename),
+                    stat_file(self.journal_filename()))
+        return stat_file(self.filename)
+
+    def compact(self, config):
+        if not self.journal:
+            return False
+        self.__write(config)
+        return True
+
+    def remove(self):
+        self._index = None
+        os.remove(self.filename)
+        if self.journal and osp.isfile(self.journal_filename()):
+            os.remove(self.journal_filename())
+
+class MemoryStorage(Storage):
+    """
+    In-memory storage: options are lost when the process exits
+    (configs sharing the same MemoryStorage instance share their options)
+    """
+    incremental = True
+
+    def __init__(self):
+        self.sections = None
+        self.version = 0
+
+    def load(self, config):
+        if self.sections is None:
+            return False
+        set_options(config, self.sections)
+        return True
+
+    def save(self, config, changes):
+        if changes is None or self.sections is None:
+            self.sections = dict([ (section, {})
+                                   for section in config._sections ])
+            changes = get_options(config)
+        sections = self.sections
+        for section, option, value in changes:
+            if option is None and value is None:
+                sections.pop(section, None)
+            elif option is None:
+                sections.setdefault(section, {})
+            elif value is None:
+                sections.get(section, {}).pop(option, None)
+            else:
+                sections.setdefault(section, {})[option] = value
+        self.version += 1
+
+    def stat(self):
+        return self.version
+
+    def remove(self):
+        self.sections = None
+        self.version += 1
+
+class SQLiteStorage(Storage):
+    """
+    SQLite database storage (requires the sqlite3 module)
+    filename: default is '.<name>.sqlite' in user home directory
+    Changed options are updated one by one, in a single transaction;
+    SQLite 'synchronous' setting follows UserConfig 'fsync' argument
+    (FSYNC_NONE: OFF, FSYNC_FILE: NORMAL, FSYNC_DIR: FULL)
+    Each section has a row whose option is '' (not a valid option name),
+    so that empty sections are stored too
+    """
+    incremental = True
+    synchronous = {FSYNC_NONE: 'OFF', FSYNC_FILE: 'NORMAL', FSYNC_DIR: 'FULL'}
+
+    def __init__(self, filename=None):
+        if sqlite3 is None:
+            raise ImportError("SQLiteStorage requires the sqlite3 module")
+        self.filename = filename
+        self._connection = None
+
+    def attach(self, name):
+        if self.filename is None:
+            self.filename = osp.join(get_home_dir(), '.%s.sqlite' % name)
+
+    def __connect(self, config):
+        """
+        Private method returning the database connection (opened once)
+        """
+        if self._connection is None:
+            # Options may be saved by UserConfig background saver thread
+            # (never while being loaded)
+            connection = sqlite3.connect(self.filename,
+                                         check_same_thread=False)
+            # Values are stored as they are in the .ini file (UTF-8 str)
+            connection.text_factory = str
+            connection.execute('PRAGMA synchronous=%s'
+                               % self.synchronous[config.fsync])
+            connection.execute('CREATE TABLE IF NOT EXISTS options '
+                               '(section TEXT, option TEXT, value TEXT, '
+                               'PRIMARY KEY (section, option))')
+            connection.commit()
+            self._connection = connection
+        return self._connection
+
+    def load(self, config):
+        sections = {}
+        rows = self.__connect(config).execute('SELECT section, option, '
+                                              'value FROM options')
+        for section, option, value in rows:
+            options = sections.setdefault(section, {})
+            if option:
+                options[option] = value
+        if not sections:
+            return False
+        set_options(config, sections)
+        return True
+
+    def save(self, config, changes):
+        connection = self.__connect(config)
+        try:
+            if changes is None:
+                connection.execute('DELETE FROM options')
+                connection.executemany('INSERT INTO options VALUES (?, ?, ?)',
+                                       get_options(config))
+                connection.executemany('INSERT INTO options VALUES '
+                                       "(?, '', NULL)",
+                                       [ (section,)
+                                         for section in config._sections ])
+            else:
+                for section, option, value in changes:
+                    if option is None and value is None:
+                        connection.execute('DELETE FROM options WHERE '
+                                           'section=?', (section,))
+                    elif option is None:
+                        connection.execute('INSERT OR IGNORE INTO options '
+                                           "VALUES (?, '', NULL)",
+                                           (section,))
+                    elif value is None:
+                        connection.execute('DELETE FROM options WHERE '
+                                           'section=? AND option=?',
+                                           (section, option))
+                    else:
+                        connection.execute('INSERT OR REPLACE INTO options '
+                                           'VALUES (?, ?, ?)',
+                                           (section, option, value))
+            connection.commit()
+        except:
+            connection.rollback()
+            raise
+
+    def stat(self):
+        return stat_file(self.filename)
+
+    def close(self):
+        """Close the database connection"""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def remove(self):
+        self.close()
+        os.remove(self.filename)
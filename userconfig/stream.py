@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+userconfig streaming parser and writer
+======================================
+
+.ini files read one line at a time, with constant memory:
+
+    for section, option, value in iter_options(file('config.ini', 'rb')):
+        ...
+
+and written again by patching them: byte ranges of sections which did not
+change are copied as is, and only changed options of other sections are
+rewritten, so that comments are kept (see FileStorage 'streaming' argument)
+
+Files are parsed as ConfigParser parses them (same syntax and errors);
+file indexes are lists of (section, start, options_end, end) byte ranges,
+in file order: 'options_end' being the end of the last option of the
+section (comments and blank lines follow), and section None the lines
+preceding the first section
+"""
+
+from ConfigParser import (RawConfigParser, DEFAULTSECT,
+                          MissingSectionHeaderError, ParsingError)
+
+
+# Entries kinds (see iter_entries)
+SECTION, OPTION, OTHER = 'section', 'option', 'other'
+
+SECTCRE = RawConfigParser.SECTCRE
+OPTCRE = RawConfigParser.OPTCRE
+
+# Size of chunks copied by copy_range
+CHUNK_SIZE = 1 << 20
+
+def lower(option):
+    """Default optionxform (see ConfigParser)"""
+    return option.lower()
+
+def is_comment(line):
+    """Return True if line is a comment (or a blank line)"""
+    return not line.strip() or line[0] in '#;' or \
+           (line[0] in 'rR' and line.split(None, 1)[0].lower() == 'rem')
+
+def iter_entries(lines, optionxform=lower, filename='<???>'):
+    """
+    Parse .ini file lines: yield (kind, section, option, value, lines)
+    entries, in order
+    kind: SECTION, OPTION (option: option name transformed by optionxform,
+          value: raw value) or OTHER (comment, blank or invalid line)
+    lines: lines of the entry (option continuation lines included)
+    MissingSectionHeaderError is raised (as by ConfigParser) when an option
+    precedes the first section, and ParsingError once all lines are parsed
+    if some lines are invalid
+    """
+    section = option = None
+    # Option being parsed (continuation lines may follow): its lines, its
+    # value lines, and the comments following it
+    entry = values = None
+    comments = []
+    error = None
+    lineno = 0
+    for line in lines:
+        lineno += 1
+        if is_comment(line):
+            if entry is None:
+                yield OTHER, section, None, None, [line]
+            else:
+                comments.append(line)
+            continue
+        if line[0].isspace() and section is not None and option is not None:
+            # Continuation line (comments in between being part of it)
+            entry.extend(comments)
+            entry.append(line)
+            values.append(line.strip())
+            comments = []
+            continue
+        if entry is not None:
+            yield OPTION, section, option, '\n'.join(values), entry
+            for comment in comments:
+                yield OTHER, section, None, None, [comment]
+            entry = values = None
+            comments = []
+        match = SECTCRE.match(line)
+        if match is not None:
+            section, option = match.group('header'), None
+            yield SECTION, section, None, None, [line]
+            continue
+        if section is None:
+            raise MissingSectionHeaderError(filename, lineno, line)
+        match = OPTCRE.match(line)
+        if match is None:
+            if error is None:
+                error = ParsingError(filename)
+            error.append(lineno, repr(line))
+            option = None
+            yield OTHER, section, None, None, [line]
+            continue
+        option, separator, value = match.group('option', 'vi', 'value')
+        option = optionxform(option.rstrip())
+        if separator in ('=', ':') and ';' in value:
+            # ';' inline comment
+            pos = value.find(';')
+            if pos != -1 and value[pos-1].isspace():
+                value = value[:pos]
+        value = value.strip()
+        if value == '""':
+            value = ''
+        entry, values = [line], [value]
+    if entry is not None:
+        yield OPTION, section, option, '\n'.join(values), entry
+        for comment in comments:
+            yield OTHER, section, None, None, [comment]
+    if error is not None:
+        raise error
+
+def iter_options(fp, optionxform=lower):
+    """
+    Yield (section, option, raw value) of the options of an .ini file
+    (opened file, or any iterable of lines), in file order
+    """
+    filename = getattr(fp, 'name', '<???>')
+    for kind, section, option, value, _lines in iter_entries(fp, optionxform,
+                                                             filename):
+        if kind is OPTION:
+            yield section, option, value
+
+def read_config(fp, config):
+    """
+    Add the options of an .ini file to a ConfigParser instance, as its
+    'readfp' method does (reading one line at a time): return the index
+    of the file (see module docstring)
+    """
+    sections = config._sections
+    filename = getattr(fp, 'name', '<???>')
+    index = []
+    current = [None, 0, 0, 0]
+    options = None
+    offset = 0
+    for kind, section, option, value, lines in iter_entries(fp,
+                                                  config.optionxform,
+                                                  filename):
+        if len(lines) == 1:
+            size = len(lines[0])
+        else:
+            size = sum([ len(line) for line in lines ])
+        if kind is OPTION:
+            options[option] = value
+            current[2] = offset+size
+        elif kind is SECTION:
+            current[3] = offset
+            if current[0] is not None or offset:
+                index.append(tuple(current))
+            current = [section, offset, offset+size, None]
+            if section == DEFAULTSECT:
+                options = config._defaults
+            else:
+                options = sections.get(section)
+                if options is None:
+                    options = sections[section] = config._dict()
+                    options['__name__'] = section
+        offset += size
+    current[3] = offset
+    if current[0] is not None or offset:
+        index.append(tuple(current))
+    return index
+
+def format_option(option, value):
+    """Return the line(s) of an option (as written by ConfigParser)"""
+    return '%s = %s\n' % (option, str(value).replace('\n', '\n\t'))
+
+def get_section(config, section):
+    """Return the options of a config section (None if it does not exist)"""
+    if section == DEFAULTSECT:
+        return config._defaults or None
+    return config._sections.get(section)
+
+def write_section(fp, section, options):
+    """
+    Write a section (as ConfigParser.write does): return its index entry
+    """
+    start = fp.tell()
+    fp.write('[%s]\n' % section)
+    fp.write(''.join([ format_option(option, value)
+                       for option, value in options.iteritems()
+                       if option != '__name__' ]))
+    options_end = fp.tell()
+    fp.write('\n')
+    return section, start, options_end, options_end+1
+
+def write_config(fp, config):
+    """
+    Write config options (as ConfigParser.write does, in a file opened in
+    binary mode): return the index of the written file
+    """
+    index = []
+    if config._defaults:
+        index.append(write_section(fp, DEFAULTSECT, config._defaults))
+    for section, options in config._sections.iteritems():
+        index.append(write_section(fp, section, options))
+    return index
+
+def iter_range(fp, start, end):
+    """Yield the lines of a file between offsets start and end"""
+    fp.seek(start)
+    remaining = end-start
+    while remaining > 0:
+        line = fp.readline(remaining)
+        if not line:
+            break
+        remaining -= len(line)
+        yield line
+
+def copy_range(source, target, start, end):
+    """
+    Copy the bytes of source between offsets start and end to target:
+    return the last two bytes copied
+    """
+    source.seek(start)
+    remaining = end-start
+    tail = ''
+    while remaining > 0:
+        data = source.read(min(CHUNK_SIZE, remaining))
+        if not data:
+            break
+        target.write(data)
+        remaining -= len(data)
+        tail = (tail+data[-2:])[-2:]
+    return tail
+
+def patch_config(source, target, index, config, changes):
+    """
+    Write config options in target by patching source file, which is
+    described by index and differs from config by changes (list of
+    (section, option, value), see 'storage' module): unchanged sections
+    are copied as is, changed options are rewritten (in place), added
+    options are written after the last option of their section, and
+    added (or replaced) sections at the end of the file
+    Return the index of the written file
+    """
+    # Changed sections: option -> value (None: removed option)
+    changed = {}
+    # Removed or replaced sections, written again from config (if found)
+    rewritten = []
+    for section, option, value in changes:
+        if option is None and value is None:
+            changed.pop(section, None)
+            if section not in rewritten:
+                rewritten.append(section)
+        elif option is None:
+            # Added section: written at the end if not in source
+            if section not in rewritten:
+                changed.setdefault(section, {})
+        elif section not in rewritten:
+            changed.setdefault(section, {})[option] = value
+    last_ranges = {}
+    for position, (section, _start, _end, _options_end) in enumerate(index):
+        last_ranges[section] = position
+    new_index = []
+    written = {}
+    # Last two bytes written
+    tail = ''
+    for position, (section, start, options_end, end) in enumerate(index):
+        if section in rewritten:
+            continue
+        new_start = target.tell()
+        options = changed.get(section)
+        if options is None:
+            tail = (tail+copy_range(source, target, start, end))[-2:]
+            new_index.append( (section, new_start,
+                               new_start+options_end-start, target.tell()) )
+            continue
+        done = written.setdefault(section, set())
+        # Lines written (or kept) and comments following the last option
+        text, trailing = [], []
+        for kind, _section, option, _value, lines in \
+            iter_entries(iter_range(source, start, end), config.optionxform):
+            if kind is not OPTION:
+                if kind is SECTION:
+                    text.extend(lines)
+                else:
+                    trailing.extend(lines)
+                continue
+            text.extend(trailing)
+            trailing = []
+            if option not in options:
+                text.extend(lines)
+                continue
+            done.add(option)
+            if options[option] is not None:
+                text.append(format_option(option, options[option]))
+            if len(text) >= 1000:
+                target.write(''.join(text))
+                text = []
+        if last_ranges[section] == position:
+            text.extend([ format_option(option, value)
+                          for option, value in options.iteritems()
+                          if option not in done and value is not None ])
+        text = ''.join(text)
+        new_options_end = target.tell()+len(text)
+        text += ''.join(trailing)
+        target.write(text)
+        tail = (tail+text[-2:])[-2:]
+        new_index.append( (section, new_start, new_options_end,
+                           target.tell()) )
+    added = [ section for section in changed if section not in last_ranges ]
+    for section in rewritten + added:
+        options = get_section(config, section)
+        if options is not None:
+            # Sections are separated by a blank line
+            if tail and not tail.endswith('\n'):
+                target.write('\n\n')
+            elif tail and tail != '\n\n':
+                target.write('\n')
+            if tail:
+                # Separator is part of the previous section range
+                new_index[-1] = new_index[-1][:3]+(target.tell(),)
+            new_index.append(write_section(target, section, options))
+            tail = '\n\n'
+    return new_index
@@ -4,9 +4,21 @@
 userconfig unit tests
 """
 
-import unittest, os
+from __future__ import with_statement
 
-from userconfig import UserConfig
+import unittest, os, threading, tempfile
+from ConfigParser import RawConfigParser
+from StringIO import StringIO
+
+from userconfig import UserConfig, NoDefault, FSYNC_FILE, FSYNC_DIR
+from codec import literal_eval, JSONCodec
+from migration import Rename, MoveSection, Transform, Drop
+from schema import Schema
+from storage import FileStorage, MemoryStorage, SQLiteStorage
+from asyncconfig import AsyncUserConfig, asyncio
+from rwlock import ReadWriteLock
+from layers import LayeredConfig, get_env_name
+from stream import iter_options
 
 OPTIONS1 = {
             'category1/list' : [5, "kk"],
@@ -32,6 +44,10 @@ OPTIONS2 = [ ('category1',
             ]
 
 
+def copy_options(options):
+    """Return a copy of options which may be changed by set_default"""
+    return [ (section, secdict.copy()) for section, secdict in options ]
+
 def conf_modified_by_user(version=None):
     conf = UserConfig('testconfig2', OPTIONS2, version=version)
     conf_file = file(conf.filename())
@@ -43,6 +59,11 @@ def conf_modified_by_user(version=None):
     conf_file.close()
     return UserConfig('testconfig2', OPTIONS2, version=version)
 
+def set_options_in_process(index, count):
+    conf = UserConfig('testconfig3', {}, merge=True)
+    for value in range(count):
+        conf.set('process%d' % index, 'option%d' % value, value)
+
 class TestFile(unittest.TestCase):
     def test_exist1(self):
         conf = UserConfig('testconfig1', OPTIONS1)
@@ -103,6 +124,110 @@ class TestFile(unittest.TestCase):
         o_str = conf.get('category2', 'str')
         self.assertEquals(o_str, 'other text')
 
+    def test_lazy(self):
+        conf = UserConfig('testconfig1', OPTIONS1)
+        conf.cleanup()
+        conf = UserConfig('testconfig1', OPTIONS1, lazy=True)
+        self.assertTrue( not os.path.isfile(conf.filename()) )
+        self.assertEquals(conf.get(None, 'category2/int'), 50)
+        self.assertTrue( os.path.isfile(conf.filename()) )
+
+    def test_lazy_load(self):
+        conf_modified_by_user(version='1.0.1')
+        conf = UserConfig('testconfig2', OPTIONS2, version='1.0.1', lazy=True)
+        self.assertEquals(dict(conf.items('category2'))['str'], 'other text')
+
+    def test_lazy_queries(self):
+        conf_modified_by_user(version='1.0.1')
+        conf = UserConfig('testconfig2', OPTIONS2, version='1.0.1', lazy=True)
+        self.assertTrue( 'category2' in conf.sections() )
+        conf = UserConfig('testconfig2', OPTIONS2, version='1.0.1', lazy=True)
+        self.assertTrue( conf.has_section('category2') )
+        conf = UserConfig('testconfig2', OPTIONS2, version='1.0.1', lazy=True)
+        self.assertTrue( conf.has_option('category2', 'str') )
+        conf = UserConfig('testconfig2', OPTIONS2, version='1.0.1', lazy=True)
+        self.assertEquals(sorted(conf.options('category2')), ['int', 'str'])
+        conf = UserConfig('testconfig2', OPTIONS2, version='1.0.1', lazy=True)
+        output = StringIO()
+        conf.write(output)
+        self.assertTrue( 'other text' in output.getvalue() )
+
+    def test_lazy_remove(self):
+        conf_modified_by_user(version='1.0.1')
+        conf = UserConfig('testconfig2', OPTIONS2, version='1.0.1', lazy=True)
+        self.assertTrue( conf.remove_option('category2', 'str') )
+        self.assertTrue( not conf.has_option('category2', 'str') )
+        conf = UserConfig('testconfig2', OPTIONS2, version='1.0.1', lazy=True)
+        self.assertTrue( conf.remove_section('category3') )
+        self.assertTrue( 'category3' not in conf.sections() )
+
+    def test_lazy_version(self):
+        conf_modified_by_user(version='1.0.0')
+        conf = UserConfig('testconfig2', OPTIONS2, version='1.0.1', lazy=True)
+        self.assertEquals(conf.get('category2', 'str'), 'text text')
+        self.assertEquals(conf.get_version(), '1.0.1')
+
+    def test_no_rewrite(self):
+        conf = UserConfig('testconfig2', OPTIONS2)
+        conf_file = file(conf.filename(), 'a')
+        conf_file.write('# comment\n')
+        conf_file.close()
+        conf = UserConfig('testconfig2', OPTIONS2)
+        conf.set('category2', 'int', 50)
+        self.assertTrue( not conf.has_unsaved_changes() )
+        self.assertTrue( '# comment' in file(conf.filename()).read() )
+        conf.set('category2', 'int', 51)
+        self.assertTrue( '# comment' not in file(conf.filename()).read() )
+
+    def test_unsaved_changes(self):
+        conf = UserConfig('testconfig2', OPTIONS2)
+        self.assertTrue( not conf.has_unsaved_changes() )
+        conf.set('category2', 'int', 51, save=False)
+        self.assertTrue( conf.has_unsaved_changes() )
+        conf.remove_option('category2', 'int')
+        conf.reset_to_defaults()
+        self.assertTrue( not conf.has_unsaved_changes() )
+
+    def test_new_default(self):
+        UserConfig('testconfig2', OPTIONS2)
+        options = OPTIONS2 + [('category4', {'int': 4})]
+        conf = UserConfig('testconfig2', options)
+        self.assertTrue( not conf.has_unsaved_changes() )
+        conf = UserConfig('testconfig2', OPTIONS2)
+        self.assertEquals(conf.get('category4', 'int'), 4)
+
+    def test_atomic_save(self):
+        conf = UserConfig('testconfig2', OPTIONS2, fsync=FSYNC_DIR)
+        os.chmod(conf.filename(), 0640)
+        conf.set('category2', 'int', 51)
+        self.assertEquals(os.stat(conf.filename()).st_mode & 0777, 0640)
+        dirname, basename = os.path.split(conf.filename())
+        self.assertEquals([name for name in os.listdir(dirname)
+                           if name.startswith(basename)], [basename])
+        conf = UserConfig('testconfig2', OPTIONS2, fsync=FSYNC_FILE)
+        self.assertEquals(conf.get('category2', 'int'), 51)
+
+    def test_symlink(self):
+        if not hasattr(os, 'symlink'):
+            return
+        conf = UserConfig('testconfig2', OPTIONS2)
+        target = tempfile.mktemp(dir=os.path.expanduser('~'))
+        os.rename(conf.filename(), target)
+        os.symlink(target, conf.filename())
+        try:
+            conf.set('category2', 'int', 51)
+            self.assertTrue( os.path.islink(conf.filename()) )
+            parser = RawConfigParser()
+            parser.read(target)
+            self.assertEquals(parser.get('category2', 'int'), '51')
+        finally:
+            os.remove(conf.filename())
+            os.remove(target)
+
+    def test_bad_fsync(self):
+        self.assertRaises(RuntimeError, UserConfig, 'testconfig2', OPTIONS2,
+                          fsync='always')
+
 
 class TestOptions1(unittest.TestCase):
 
@@ -213,6 +338,1061 @@ class TestOptions2(unittest.TestCase):
         o_default = self.conf.get('category3', 'unknown', default=23)
         self.assertEquals(o_default, 23)
 
+    def test_duplicate_section(self):
+        defaults = copy_options(OPTIONS2) + [('category1', {'float': 0.,
+                                                            'new': 2.5})]
+        self.conf = UserConfig('testconfig2', defaults, load=False)
+        self.assertEquals(self.conf.get_default('category1', 'float'), 12.3)
+        self.assertEquals(self.conf.get_default('category1', 'new'), 2.5)
+        self.conf.set('category1', 'new', 3)
+        self.assertEquals(self.conf.get('category1', 'new'), 3.)
+        self.conf.set_default('category1', 'new', 1.5)
+        self.conf.reset_to_defaults()
+        self.assertEquals(self.conf.get('category1', 'new'), 1.5)
+
+    def test_set_default(self):
+        self.conf = UserConfig('testconfig2', copy_options(OPTIONS2),
+                               load=False)
+        self.conf.set_default('category1', 'float', 1.5)
+        self.assertEquals(self.conf.get_default('category1', 'float'), 1.5)
+        self.conf.reset_to_defaults(save=False)
+        self.assertEquals(self.conf.get('category1', 'float'), 1.5)
+
+    def test_set_as_defaults(self):
+        self.conf.set('category2', 'int', 10)
+        self.conf.set_as_defaults()
+        self.assertEquals(self.conf.get_default('category2', 'int'), '10')
+
+    def test_get_section(self):
+        self.assertEquals(self.conf.get_section('category1'),
+                          {'float': 12.3, 'bool': True})
+        self.assertRaises(RuntimeError, self.conf.get_section, 'unknown')
+
+    def test_get_many(self):
+        keys = [('category1', 'float'), ('category2', 'str')]
+        self.assertEquals(self.conf.get_many(keys),
+                          {('category1', 'float'): 12.3,
+                           ('category2', 'str'): 'text text'})
+        self.assertRaises(RuntimeError, self.conf.get_many,
+                          [('category1', 'unknown')])
+
+    def test_update(self):
+        self.conf = UserConfig('testconfig2', copy_options(OPTIONS2),
+                               load=False)
+        self.conf.update({'category1': {'float': 1.5},
+                          'category2': {'int': '2', 'new': 'value'}})
+        conf = UserConfig('testconfig2', OPTIONS2)
+        self.assertEquals(conf.get('category1', 'float'), 1.5)
+        self.assertEquals(conf.get('category2', 'int'), 2)
+        self.assertEquals(conf.get('category2', 'new'), 'value')
+
+    def test_update_atomic(self):
+        self.assertRaises(ValueError, self.conf.update,
+                          [('category1', 'float', 1.5),
+                           ('category2', 'int', 'not an int')])
+        self.assertEquals(self.conf.get('category1', 'float'), 12.3)
+        self.assertRaises(RuntimeError, self.conf.update,
+                          [('category1', 'float', 1.5),
+                           ('default', 'option', 1)])
+        self.assertEquals(self.conf.get('category1', 'float'), 12.3)
+        self.assertTrue( not self.conf.has_unsaved_changes() )
+
+    def test_set_section(self):
+        self.conf.set_section('category2', {'int': 2, 'str': 'foo'})
+        self.assertEquals(self.conf.get_section('category2'),
+                          {'int': 2, 'str': 'foo'})
+
+
+class TestBatch(unittest.TestCase):
+
+    def setUp(self):
+        self.conf = UserConfig('testconfig2', OPTIONS2, load=False)
+        
+    def tearDown(self):
+        self.conf.cleanup()
+        
+    def test_single_write(self):
+        with self.conf.batch():
+            self.conf.set('category1', 'float', 14.5)
+            self.conf.set('category2', 'int', 10)
+            conf = UserConfig('testconfig2', OPTIONS2)
+            self.assertEquals(conf.get('category1', 'float'), 12.3)
+        conf = UserConfig('testconfig2', OPTIONS2)
+        self.assertEquals(conf.get('category1', 'float'), 14.5)
+        self.assertEquals(conf.get('category2', 'int'), 10)
+
+    def test_rollback(self):
+        try:
+            with self.conf.batch():
+                self.conf.set('category1', 'float', 14.5)
+                self.conf.set('category1', 'new', 'value')
+                raise ValueError
+        except ValueError:
+            pass
+        self.assertEquals(self.conf.get('category1', 'float'), 12.3)
+        self.assertTrue( not self.conf.has_option('category1', 'new') )
+        conf = UserConfig('testconfig2', OPTIONS2)
+        self.assertEquals(conf.get('category1', 'float'), 12.3)
+
+    def test_nested(self):
+        with self.conf.batch():
+            with self.conf.batch():
+                self.conf.set('category1', 'float', 14.5)
+            conf = UserConfig('testconfig2', OPTIONS2)
+            self.assertEquals(conf.get('category1', 'float'), 12.3)
+        conf = UserConfig('testconfig2', OPTIONS2)
+        self.assertEquals(conf.get('category1', 'float'), 14.5)
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.conf = UserConfig('testconfig1', OPTIONS1, load=False)
+        
+    def tearDown(self):
+        self.conf.cleanup()
+        
+    def test_hits(self):
+        self.conf.get(None, 'category1/list')
+        self.conf.get(None, 'category1/list')
+        info = self.conf.get_cache_info()
+        self.assertEquals((info['hits'], info['misses']), (1, 1))
+
+    def test_set(self):
+        self.conf.get(None, 'category1/list')
+        self.conf.set(None, 'category1/list', [1, 2], save=False)
+        self.assertEquals(self.conf.get(None, 'category1/list'), [1, 2])
+
+    def test_interpolation(self):
+        conf = UserConfig('testconfig2', [('section', {'a': 1,
+                                                       'b': '%(a)s/y'})],
+                          load=False)
+        self.assertEquals(conf.get('section', 'b'), '1/y')
+        self.assertEquals(conf.get_section('section')['b'], '1/y')
+        conf.set('section', 'a', 2, save=False)
+        self.assertEquals(conf.get('section', 'b'), '2/y')
+        self.assertEquals(conf.get_section('section')['b'], '2/y')
+        self.assertEquals(conf.get_many([('section', 'b')]),
+                          {('section', 'b'): '2/y'})
+
+    def test_mutable(self):
+        self.conf.get(None, 'category1/list').append(99)
+        self.conf.get_section('main')['category1/list'].append(99)
+        self.conf.get_many([(None, 'category1/list')])[
+                                        (None, 'category1/list')].append(99)
+        self.assertEquals(self.conf.get(None, 'category1/list'), [5, 'kk'])
+
+    def test_reset_to_defaults(self):
+        self.conf.set(None, 'category2/int', 10, save=False)
+        self.conf.get(None, 'category2/int')
+        self.conf.reset_to_defaults(save=False)
+        self.assertEquals(self.conf.get(None, 'category2/int'), 50)
+
+    def test_read(self):
+        self.conf.get(None, 'category2/int')
+        conf = UserConfig('testconfig1', OPTIONS1)
+        conf.set(None, 'category2/int', 10)
+        self.conf.read(self.conf.filename())
+        self.assertEquals(self.conf.get(None, 'category2/int'), 10)
+
+    def test_remove_option(self):
+        self.conf.get(None, 'category2/int')
+        self.conf.remove_option('main', 'category2/int')
+        self.assertRaises(RuntimeError, self.conf.get, None, 'category2/int')
+
+
+class TestCodec(unittest.TestCase):
+
+    def test_literals(self):
+        for value in (0, -12, 2**70, 1.5, -2e-10, True, False, None,
+                      'text', "it's", 'a\nb\\', u'ééǿùùàà', [], (), {},
+                      [5, "kk"], (None, "foo"), (1,), {'a': [1, (2, 3)]},
+                      [1, [2.5, -3]], ["it's"]):
+            self.assertEquals(literal_eval(repr(value)), value)
+            self.assertEquals(type(literal_eval(repr(value))), type(value))
+
+    def test_not_literals(self):
+        for text in ("__import__('os')", "text text", "1+2", "[1, 2",
+                     "[NaN]", "[true]", "[1, null]",
+                     "(1 2)", "{[]: 1}", ""):
+            self.assertRaises(ValueError, literal_eval, text)
+
+    def test_unquoted_str(self):
+        conf = UserConfig('testconfig1', OPTIONS1, load=False)
+        conf.set(None, 'category2/str', "__import__('os')")
+        self.assertEquals(conf.get(None, 'category2/str'), "__import__('os')")
+        conf.cleanup()
+
+    def test_json(self):
+        conf = UserConfig('testconfig1', OPTIONS1, codec=JSONCodec())
+        conf.set(None, 'category1/list', [14.5, "jj"])
+        conf = UserConfig('testconfig1', OPTIONS1, codec=JSONCodec())
+        self.assertEquals(conf.get(None, 'category1/list'), [14.5, "jj"])
+        self.assertEquals(conf.get(None, 'category1/float'), 12.3)
+        conf.cleanup()
+
+
+class TestReload(unittest.TestCase):
+
+    def setUp(self):
+        self.changes = []
+        self.conf = UserConfig('testconfig2', OPTIONS2, auto_reload=0,
+                               reload_callback=self.callback)
+        
+    def tearDown(self):
+        self.conf.cleanup()
+
+    def callback(self, conf, changed):
+        self.changes.append(changed)
+        
+    def test_auto_reload(self):
+        self.assertEquals(self.conf.get('category2', 'int'), 50)
+        UserConfig('testconfig2', OPTIONS2).set('category2', 'int', 51)
+        self.assertEquals(self.conf.get('category2', 'int'), 51)
+        self.assertEquals(self.changes, [[('category2', 'int')]])
+        self.conf.get('category2', 'int')
+        self.assertEquals(len(self.changes), 1)
+
+    def test_interval(self):
+        self.conf.auto_reload = 3600
+        self.conf.get('category2', 'int')
+        UserConfig('testconfig2', OPTIONS2).set('category2', 'int', 51)
+        self.assertEquals(self.conf.get('category2', 'int'), 50)
+        self.assertEquals(self.conf.reload(), [('category2', 'int')])
+
+    def test_batch(self):
+        with self.conf.batch():
+            self.conf.set('category2', 'int', 10)
+            UserConfig('testconfig2', OPTIONS2).set('category2', 'str', 'x')
+            self.assertEquals(self.conf.get('category2', 'int'), 10)
+        self.assertEquals(UserConfig('testconfig2', OPTIONS2).get(
+                                                 'category2', 'int'), 10)
+
+    def test_unsaved_changes(self):
+        self.conf.set('category2', 'int', 10, save=False)
+        UserConfig('testconfig2', OPTIONS2).set('category2', 'str', 'x')
+        self.assertEquals(self.conf.get('category2', 'int'), 10)
+        self.conf.save()
+        self.assertEquals(UserConfig('testconfig2', OPTIONS2).get(
+                                                 'category2', 'int'), 10)
+
+    def test_own_save(self):
+        self.conf.set('category2', 'int', 51)
+        self.conf.get('category2', 'int')
+        self.assertEquals(self.changes, [])
+
+
+class TestSubscribe(unittest.TestCase):
+
+    def setUp(self):
+        self.notified = []
+        self.conf = UserConfig('testconfig1', OPTIONS1, load=False)
+        
+    def tearDown(self):
+        self.conf.cleanup()
+
+    def callback(self, section, option, old_value, new_value):
+        self.notified.append( (section, option, old_value, new_value) )
+
+    def test_set(self):
+        self.conf.subscribe(None, 'category1/list', self.callback)
+        self.conf.set(None, 'category1/list', [1])
+        self.conf.set(None, 'category1/list', [1])
+        self.conf.set(None, 'category2/int', 1)
+        self.assertEquals(self.notified,
+                          [('main', 'category1/list', [5, "kk"], [1])])
+
+    def test_wildcards(self):
+        self.conf.subscribe('*', 'category2/int', self.callback)
+        self.conf.subscribe(None, '*', self.callback)
+        self.conf.set(None, 'category2/int', 1)
+        self.conf.unsubscribe(None, '*', self.callback)
+        self.conf.set(None, 'category2/int', 2)
+        self.assertEquals(len(self.notified), 3)
+
+    def test_coalesce(self):
+        self.conf.subscribe('*', '*', self.callback)
+        with self.conf.batch():
+            self.conf.set(None, 'category2/int', 1)
+            self.conf.set(None, 'category2/int', 2)
+            self.conf.set(None, 'category1/float', 1.5)
+            self.conf.set(None, 'category1/float', 12.3)
+        self.assertEquals(self.notified, [('main', 'category2/int', 50, 2)])
+        del self.notified[:]
+        self.conf.reset_to_defaults()
+        self.assertEquals(self.notified, [('main', 'category2/int', 2, 50)])
+
+    def test_remove(self):
+        self.conf.subscribe('*', '*', self.callback)
+        self.conf.remove_option('main', 'category2/int')
+        self.assertEquals(self.notified,
+                          [('main', 'category2/int', 50, NoDefault)])
+
+    def test_reload(self):
+        self.conf.subscribe('*', '*', self.callback)
+        UserConfig('testconfig1', OPTIONS1).set(None, 'category2/int', 1)
+        self.conf.reload()
+        self.assertEquals(self.notified, [('main', 'category2/int', 50, 1)])
+
+
+OPTIONS3 = [ ('category1',
+              {'float' : 12.3,
+               'boolean' : True,
+               }),
+             ('category4',
+              {'int' : 50,
+               'str' : 'text text',
+               }),
+            ]
+
+MIGRATIONS = {'1.1.0': [Rename('category1', 'bool', 'boolean'),
+                        MoveSection('category2', 'category4'),
+                        Drop('category3')],
+              '1.0.1': [Transform('category1', 'float', lambda x: x*2)],
+              '1.0.0': [Drop('category1')],
+              }
+
+class TestMigration(unittest.TestCase):
+
+    def setUp(self):
+        conf = UserConfig('testconfig2', copy_options(OPTIONS2),
+                          version='1.0.0')
+        conf.set('category1', 'bool', False)
+        conf.set('category2', 'str', 'other text')
+        conf.set('category2', 'deprecated', 1)
+
+    def tearDown(self):
+        UserConfig('testconfig2', OPTIONS2, load=False).cleanup()
+
+    def test_migrate(self):
+        conf = UserConfig('testconfig2', OPTIONS3, version='1.1.0',
+                          migrations=MIGRATIONS)
+        self.assertEquals(conf.get('category1', 'float'), 24.6)
+        self.assertEquals(conf.get('category1', 'boolean'), False)
+        self.assertEquals(conf.get('category4', 'str'), 'other text')
+        self.assertEquals(conf.get_version(), '1.1.0')
+        self.assertEquals(sorted(conf.sections()),
+                          ['category1', 'category4', 'main'])
+        self.assertTrue( not conf.has_option('category4', 'deprecated') )
+
+    def test_partial(self):
+        conf = UserConfig('testconfig2', copy_options(OPTIONS2),
+                          version='1.0.1', migrations=MIGRATIONS)
+        self.assertEquals(conf.get('category1', 'float'), 24.6)
+        conf = UserConfig('testconfig2', OPTIONS3, version='1.1.0',
+                          migrations=MIGRATIONS)
+        self.assertEquals(conf.get('category1', 'float'), 24.6)
+        self.assertEquals(conf.get('category4', 'str'), 'other text')
+
+    def test_same_version(self):
+        conf = UserConfig('testconfig2', copy_options(OPTIONS2),
+                          version='1.0.0', migrations=MIGRATIONS)
+        self.assertEquals(conf.get('category1', 'bool'), False)
+        self.assertEquals(conf.get('category2', 'deprecated'), 1)
+
+    def test_bad_version(self):
+        self.assertRaises(RuntimeError, UserConfig, 'testconfig2', OPTIONS2,
+                          migrations={'1.0': []})
+
+
+def check_positive(value):
+    if value <= 0:
+        raise ValueError("Value must be positive")
+
+class TestSchema(unittest.TestCase):
+
+    def setUp(self):
+        schema = Schema(copy_options(OPTIONS2),
+                        validators={('category2', 'int'): check_positive})
+        self.conf = UserConfig('testconfig2', schema)
+        
+    def tearDown(self):
+        self.conf.cleanup()
+
+    def test_get(self):
+        self.assertEquals(self.conf.get('category1', 'float'), 12.3)
+        self.assertEquals(self.conf.category2.str, 'text text')
+        self.assertEquals(self.conf.category3.unicode, u'ééǿùùàà')
+
+    def test_set(self):
+        self.conf.category2.int = 10.0
+        self.assertEquals(self.conf.get('category2', 'int'), 10)
+        conf = UserConfig('testconfig2', OPTIONS2)
+        self.assertEquals(conf.get('category2', 'int'), 10)
+
+    def test_validator(self):
+        self.assertRaises(ValueError, self.conf.set, 'category2', 'int', -1)
+        self.assertEquals(self.conf.category2.int, 50)
+
+    def test_attributes(self):
+        self.assertRaises(AttributeError, getattr, self.conf, 'category5')
+        self.assertRaises(AttributeError, getattr, self.conf.category1, 'x')
+        self.assertEquals(len(self.conf.schema),
+                          sum([len(options) for _s, options in OPTIONS2]))
+
+
+class TestSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.options = copy_options(OPTIONS2)
+        self.options[0][1]['list'] = [5, 'kk', (None, 1.5)]
+        conf = UserConfig('testconfig2', self.options, snapshot_cache=True)
+        conf.set('category1', 'list', [6, u'ǿ', {'a': 1L}])
+        self.conf = UserConfig('testconfig2', self.options,
+                               snapshot_cache=True)
+
+    def tearDown(self):
+        self.conf.cleanup()
+
+    def test_warm_load(self):
+        self.assert_(os.path.isfile(self.conf.filename()+'.cache'))
+        conf = UserConfig('testconfig2', self.options, snapshot_cache=True)
+        self.assertEquals(conf.get('category1', 'list'),
+                          [6, u'ǿ', {'a': 1L}])
+        self.assertEquals(conf.get('category3', 'unicode'), u'ééǿùùàà')
+        self.assertEquals(conf.get_cache_info()['misses'], 0)
+        self.assertEquals(conf.get_section('category2'),
+                          self.conf.get_section('category2'))
+
+    def test_modified_file(self):
+        conf_file = file(self.conf.filename(), 'a')
+        conf_file.write('[category4]\noption = 1\n')
+        conf_file.close()
+        conf = UserConfig('testconfig2', self.options, snapshot_cache=True)
+        self.assertEquals(conf.get('category4', 'option'), 1)
+
+    def test_corrupted_cache(self):
+        cache_file = file(self.conf.filename()+'.cache', 'r+b')
+        cache_file.seek(60)
+        cache_file.write('\xff'*20)
+        cache_file.truncate(100)
+        cache_file.close()
+        conf = UserConfig('testconfig2', self.options, snapshot_cache=True)
+        self.assertEquals(conf.get('category1', 'list'),
+                          [6, u'ǿ', {'a': 1L}])
+
+
+class TestMerge(unittest.TestCase):
+
+    def tearDown(self):
+        UserConfig('testconfig3', {}, load=False).cleanup()
+
+    def test_merge(self):
+        conf1 = UserConfig('testconfig3', OPTIONS2, merge=True)
+        conf2 = UserConfig('testconfig3', OPTIONS2, merge=True)
+        conf1.set('category1', 'float', 1.5)
+        conf2.remove_section('category3')
+        conf2.set('category2', 'int', 2)
+        conf1.set('category2', 'str', 'conf1')
+        self.assertEquals(conf1.get('category2', 'int'), 2)
+        self.assertTrue( not conf1.has_section('category3') )
+        conf = UserConfig('testconfig3', OPTIONS2)
+        self.assertEquals(conf.get('category1', 'float'), 1.5)
+        self.assertEquals(conf.get('category2', 'int'), 2)
+        self.assertEquals(conf.get('category2', 'str'), 'conf1')
+
+    def test_compact(self):
+        conf = UserConfig('testconfig3', OPTIONS2, merge=True)
+        conf.set('category2', 'int', 7, save=False)
+        conf.compact()
+        conf.save()
+        self.assertEquals(conf.get('category2', 'int'), 7)
+        conf = UserConfig('testconfig3', OPTIONS2)
+        self.assertEquals(conf.get('category2', 'int'), 7)
+
+    def test_storages(self):
+        for storage in (FileStorage(streaming=True), SQLiteStorage()):
+            conf1 = UserConfig('testconfig3', OPTIONS2, merge=True,
+                               storage=storage)
+            conf2 = UserConfig('testconfig3', OPTIONS2, merge=True,
+                               storage=storage)
+            self.assertEquals(conf1.get('category2', 'int'), 50)
+            conf2.set('category2', 'int', 2)
+            conf1.set('category2', 'str', 'conf1')
+            self.assertEquals(conf1.get('category2', 'int'), 2)
+            self.assertEquals(conf1.get_section('category2'),
+                              {'int': 2, 'str': 'conf1'})
+        conf1.cleanup()
+
+    def test_lost_updates(self):
+        conf1 = UserConfig('testconfig3', OPTIONS2, lock=True)
+        conf2 = UserConfig('testconfig3', OPTIONS2, lock=True)
+        conf1.set('category1', 'float', 1.5)
+        conf2.set('category2', 'int', 2)
+        conf = UserConfig('testconfig3', OPTIONS2)
+        self.assertEquals(conf.get('category1', 'float'), 12.3)
+
+    def test_processes(self):
+        try:
+            import multiprocessing
+        except ImportError:
+            return
+        processes = [ multiprocessing.Process(target=set_options_in_process,
+                                              args=(index, 20))
+                      for index in range(4) ]
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+        conf = UserConfig('testconfig3', {})
+        for index in range(4):
+            self.assertEquals(conf.get('process%d' % index, 'option19'), 19)
+            self.assertEquals(len(conf.items('process%d' % index)), 20)
+
+
+class TestStorage(unittest.TestCase):
+
+    def test_memory(self):
+        storage = MemoryStorage()
+        conf = UserConfig('testconfig2', OPTIONS2, storage=storage)
+        self.assertEquals(conf.filename(), None)
+        conf.remove_section('category3')
+        conf.set('category2', 'str', 'memory')
+        self.assertTrue( 'category3' not in storage.sections )
+        conf = UserConfig('testconfig2', OPTIONS2, storage=storage)
+        self.assertEquals(conf.get('category2', 'str'), 'memory')
+        self.assertTrue( not os.path.isfile(UserConfig('testconfig2', {},
+                                            load=False).filename()) )
+        conf.cleanup()
+        self.assertEquals(storage.sections, None)
+
+    def test_sqlite(self):
+        storage = SQLiteStorage()
+        conf = UserConfig('testconfig2', OPTIONS2, storage=storage)
+        self.assertTrue( conf.filename().endswith('.testconfig2.sqlite') )
+        conf.set('category3', 'unicode', u'ǿ')
+        # Options written by another process are not overwritten
+        storage._SQLiteStorage__connect(conf).execute(
+            "INSERT INTO options VALUES ('category4', 'other', '1')")
+        conf.set('category2', 'int', 2)
+        conf.remove_option('category1', 'bool')
+        storage.close()
+        conf = UserConfig('testconfig2', OPTIONS2,
+                          storage=SQLiteStorage(conf.filename()))
+        self.assertEquals(conf.get('category3', 'unicode'), u'ǿ')
+        self.assertEquals(conf.get('category2', 'int'), 2)
+        self.assertEquals(conf.get('category4', 'other'), 1)
+        self.assertEquals(conf.get('category1', 'bool'), True)
+        conf.cleanup()
+        self.assertTrue( not os.path.isfile(conf.filename()) )
+
+    def test_empty_section(self):
+        for storage in (MemoryStorage(), SQLiteStorage(),
+                        FileStorage(journal=True), FileStorage(streaming=True)):
+            conf = UserConfig('testconfig2', OPTIONS2, storage=storage)
+            conf.add_section('empty')
+            conf.remove_section('category3')
+            conf.add_section('category3')
+            conf.save()
+            conf = UserConfig('testconfig2', OPTIONS2, storage=storage)
+            self.assertTrue( conf.has_section('empty') )
+            self.assertEquals(conf.options('empty'), [])
+            conf.set('empty', 'option', 1)
+            conf = UserConfig('testconfig2', OPTIONS2, storage=storage)
+            self.assertEquals(conf.get('empty', 'option'), 1)
+            conf.cleanup()
+
+    def test_close(self):
+        for storage in (FileStorage(), SQLiteStorage()):
+            conf = UserConfig('testconfig2', OPTIONS2, storage=storage)
+            conf.set('category2', 'int', 2, save=False)
+            conf.close()
+            conf = UserConfig('testconfig2', OPTIONS2, storage=storage)
+            self.assertEquals(conf.get('category2', 'int'), 2)
+            conf.cleanup()
+
+    def test_file_path(self):
+        filename = os.path.join(os.path.expanduser('~'), 'testconfig2.ini')
+        conf = UserConfig('testconfig2', OPTIONS2,
+                          storage=FileStorage(filename))
+        self.assertEquals(conf.filename(), filename)
+        self.assertTrue( os.path.isfile(filename) )
+        conf.cleanup()
+
+
+class TestJournal(unittest.TestCase):
+
+    def setUp(self):
+        self.conf = self.load()
+        self.journal = self.conf.filename()+'.journal'
+
+    def tearDown(self):
+        self.conf.cleanup()
+        self.assertTrue( not os.path.isfile(self.journal) )
+
+    def load(self, journal_size=65536):
+        return UserConfig('testconfig2', copy_options(OPTIONS2),
+                          storage=FileStorage(journal=True,
+                                              journal_size=journal_size))
+
+    def test_journal(self):
+        self.conf.set('category1', 'float', 1.5)
+        size = os.path.getsize(self.conf.filename())
+        self.conf.set('category2', 'str', 'tab\there\nnew line')
+        self.conf.set('category3', 'unicode', u'ǿ')
+        self.conf.remove_section('category1')
+        self.conf.set('category2', 'int', 2)
+        self.assertEquals(os.path.getsize(self.conf.filename()), size)
+        conf = self.load()
+        self.assertEquals(conf.get('category2', 'str'), 'tab\there\nnew line')
+        self.assertEquals(conf.get('category3', 'unicode'), u'ǿ')
+        self.assertEquals(conf.get('category2', 'int'), 2)
+        self.assertEquals(conf.get('category1', 'float'), 12.3)
+
+    def test_compact(self):
+        self.conf.set('category2', 'int', 2)
+        self.assertTrue( os.path.isfile(self.journal) )
+        self.conf.close()
+        self.assertTrue( not os.path.isfile(self.journal) )
+        conf = UserConfig('testconfig2', OPTIONS2)
+        self.assertEquals(conf.get('category2', 'int'), 2)
+
+    def test_size_threshold(self):
+        conf = self.load(journal_size=100)
+        for value in range(10):
+            conf.set('category2', 'int', value)
+            self.assertTrue( not os.path.isfile(self.journal) or
+                             os.path.getsize(self.journal) <= 100 )
+        self.assertEquals(self.load().get('category2', 'int'), 9)
+
+    def test_interrupted_record(self):
+        self.conf.set('category2', 'int', 2)
+        journal_file = file(self.journal, 'ab')
+        journal_file.write('=\tcategory2\tint\t3')
+        journal_file.close()
+        self.assertEquals(self.load().get('category2', 'int'), 2)
+        self.conf.set('category2', 'str', 'after')
+        conf = self.load()
+        self.assertEquals(conf.get('category2', 'int'), 2)
+        self.assertEquals(conf.get('category2', 'str'), 'after')
+
+
+class FailingStorage(MemoryStorage):
+    """Memory storage failing to save while 'failing' is True"""
+    failing = False
+    def save(self, config, changes):
+        if self.failing:
+            raise IOError("Storage not available")
+        MemoryStorage.save(self, config, changes)
+
+class TestSaver(unittest.TestCase):
+
+    def test_delay(self):
+        conf = UserConfig('testconfig2', OPTIONS2, save_delay=60)
+        conf.flush()
+        for value in range(10):
+            conf.set('category2', 'int', value)
+        self.assertTrue( conf.has_unsaved_changes() )
+        self.assertEquals(UserConfig('testconfig2', OPTIONS2,
+                                     load=False).get('category2', 'int'), 50)
+        self.assertEquals(UserConfig('testconfig2', OPTIONS2
+                                     ).get('category2', 'int'), 50)
+        conf.flush()
+        self.assertTrue( not conf.has_unsaved_changes() )
+        self.assertEquals(UserConfig('testconfig2', OPTIONS2
+                                     ).get('category2', 'int'), 9)
+        conf.close()
+        conf.cleanup()
+
+    def test_close(self):
+        storage = SQLiteStorage()
+        conf = UserConfig('testconfig2', OPTIONS2, storage=storage,
+                          save_delay=0.01)
+        conf.set('category2', 'int', 2)
+        conf.remove_option('category2', 'str')
+        conf.set('category3', 'unicode', u'ǿ')
+        conf.close()
+        conf = UserConfig('testconfig2', OPTIONS2, storage=storage)
+        self.assertEquals(conf.get('category2', 'int'), 2)
+        self.assertEquals(conf.get('category3', 'unicode'), u'ǿ')
+        conf.cleanup()
+
+    def test_error(self):
+        storage = FailingStorage()
+        conf = UserConfig('testconfig2', OPTIONS2, storage=storage,
+                          save_delay=0)
+        conf.flush()
+        storage.failing = True
+        conf.set('category2', 'int', 2)
+        self.assertRaises(IOError, conf.flush)
+        conf.set('category1', 'float', 1.5)
+        storage.failing = False
+        conf.flush()
+        conf = UserConfig('testconfig2', OPTIONS2, storage=storage)
+        self.assertEquals(conf.get('category2', 'int'), 2)
+        self.assertEquals(conf.get('category1', 'float'), 1.5)
+
+
+class TestAsync(unittest.TestCase):
+
+    def setUp(self):
+        if asyncio is not None:
+            self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        if asyncio is not None:
+            self.loop.close()
+            UserConfig('testconfig2', {}, load=False).cleanup()
+
+    def run_coroutine(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def test_load_save(self):
+        if asyncio is None:
+            return
+        conf = AsyncUserConfig('testconfig2', OPTIONS2, loop=self.loop)
+        self.assertRaises(RuntimeError, getattr, conf, 'get')
+        self.run_coroutine(conf.load())
+        self.assertEquals(conf.get('category2', 'int'), 50)
+        conf.set('category2', 'int', 2, save=False)
+        self.run_coroutine(conf.save())
+        self.assertEquals(UserConfig('testconfig2', OPTIONS2
+                                     ).get('category2', 'int'), 2)
+        self.run_coroutine(conf.close())
+
+    def test_reload_if_changed(self):
+        if asyncio is None:
+            return
+        conf = AsyncUserConfig('testconfig2', OPTIONS2, loop=self.loop)
+        self.run_coroutine(conf.load())
+        self.assertEquals(self.run_coroutine(conf.reload_if_changed()), [])
+        UserConfig('testconfig2', OPTIONS2).set('category1', 'float', 1.5)
+        self.assertEquals(self.run_coroutine(conf.reload_if_changed()),
+                          [('category1', 'float')])
+        self.assertEquals(conf.get('category1', 'float'), 1.5)
+        self.run_coroutine(conf.close())
+
+    def test_concurrent(self):
+        if asyncio is None:
+            return
+        conf = AsyncUserConfig('testconfig2', OPTIONS2, loop=self.loop)
+        @asyncio.coroutine
+        def task(index):
+            for value in range(10):
+                conf.set('tasks', 'task%d' % index, value)
+                yield asyncio.From(conf.save())
+        self.run_coroutine(conf.load())
+        self.run_coroutine(asyncio.wait([task(index) for index in range(5)],
+                                        loop=self.loop))
+        self.run_coroutine(conf.close())
+        conf = UserConfig('testconfig2', OPTIONS2)
+        for index in range(5):
+            self.assertEquals(conf.get('tasks', 'task%d' % index), 9)
+
+
+class TestThreadSafe(unittest.TestCase):
+
+    def setUp(self):
+        self.errors = []
+
+    def tearDown(self):
+        conf = UserConfig('testconfig2', {}, load=False)
+        if os.path.isfile(conf.filename()):
+            conf.cleanup()
+
+    def run_threads(self, *functions):
+        def run(function):
+            try:
+                function()
+            except Exception, error:
+                self.errors.append(error)
+        threads = [ threading.Thread(target=run, args=(function,))
+                    for function in functions ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEquals(self.errors, [])
+
+    def test_readers_writers(self):
+        conf = UserConfig('testconfig2', copy_options(OPTIONS2),
+                          thread_safe=True, lazy=True)
+        def write(index):
+            for value in range(50):
+                conf.set('thread%d' % index, 'option%d' % value, value)
+        def read():
+            for _index in range(200):
+                for section in conf.sections():
+                    conf.items(section)
+                    conf.get_section(section)
+                conf.get('category2', 'int')
+        self.run_threads(*([lambda index=index: write(index)
+                            for index in range(4)] + [read]*4))
+        conf = UserConfig('testconfig2', OPTIONS2)
+        for index in range(4):
+            self.assertEquals(conf.get_section('thread%d' % index),
+                              dict([ ('option%d' % value, value)
+                                     for value in range(50) ]))
+
+    def test_get_default(self):
+        conf = UserConfig('testconfig2', copy_options(OPTIONS2),
+                          thread_safe=True)
+        values = []
+        def get():
+            values.append(conf.get('category4', 'option', 4))
+        self.run_threads(*[get]*8)
+        self.assertEquals(values, [4]*8)
+        self.assertEquals(conf.get('category4', 'option'), 4)
+
+    def test_batch(self):
+        conf = UserConfig('testconfig2', copy_options(OPTIONS2),
+                          thread_safe=True)
+        def batch():
+            with conf.batch():
+                value = conf.get('category2', 'int')
+                conf.set('category2', 'int', value+1)
+        self.run_threads(*[batch]*8)
+        self.assertEquals(conf.get('category2', 'int'), 58)
+
+    def test_auto_reload(self):
+        conf = UserConfig('testconfig2', copy_options(OPTIONS2),
+                          thread_safe=True, auto_reload=0)
+        self.assertEquals(conf.get('category2', 'int'), 50)
+        self.assertEquals(conf.get_section('category2')['int'], 50)
+        UserConfig('testconfig2', copy_options(OPTIONS2)).set('category2',
+                                                              'int', 60)
+        def read():
+            for _index in range(20):
+                conf.get('category2', 'int')
+                conf.get_many([('category2', 'str'), (None, 'version')])
+        self.run_threads(*[read]*4)
+        self.assertEquals(conf.get('category2', 'int'), 60)
+
+    def test_upgrade(self):
+        lock = ReadWriteLock()
+        lock.acquire_read()
+        self.assertRaises(RuntimeError, lock.acquire_write)
+        lock.release_read()
+        lock.acquire_write()
+        lock.acquire_read()
+        lock.release_read()
+        lock.release_write()
+
+
+class TestLayers(unittest.TestCase):
+
+    def setUp(self):
+        handle, self.system_file = tempfile.mkstemp(suffix='.ini')
+        os.write(handle, "[category2]\nint = 60\n[category4]\nstr = 'system'\n")
+        os.close(handle)
+        self.environ = {}
+        self.conf = UserConfig('testconfig2', OPTIONS2)
+        self.layers = LayeredConfig(self.conf, [self.system_file],
+                                    environ=self.environ)
+
+    def tearDown(self):
+        self.layers.close()
+        self.conf.cleanup()
+        os.remove(self.system_file)
+
+    def test_precedence(self):
+        layers = self.layers
+        self.assertEquals(layers.get('category1', 'float'), 12.3)
+        self.assertEquals(layers.which('category1', 'float'), 'default')
+        self.assertEquals(layers.get('category2', 'int'), 60)
+        self.assertEquals(layers.which('category2', 'int'), 'system')
+        self.assertEquals(layers.get('category4', 'str'), 'system')
+        layers.set('category2', 'int', 70)
+        self.assertEquals(layers.get('category2', 'int'), 70)
+        self.assertEquals(layers.which('category2', 'int'), 'user')
+        self.environ[get_env_name('TESTCONFIG2_', 'category2', 'int')] = '80'
+        layers.reload()
+        self.assertEquals(layers.get('category2', 'int'), 80)
+        self.assertEquals(layers.which('category2', 'int'), 'environment')
+        layers.override('category2', 'int', 90)
+        self.assertEquals(layers.get('category2', 'int'), 90)
+        self.assertEquals(layers.which('category2', 'int'), 'runtime')
+        layers.remove_override('category2', 'int')
+        self.assertEquals(layers.get('category2', 'int'), 80)
+        self.assertEquals(self.conf.get('category2', 'int'), 70)
+
+    def test_user_default(self):
+        # User values equal to defaults don't hide system values
+        self.conf.set('category2', 'int', 70)
+        self.conf.set('category2', 'int', 50)
+        self.assertEquals(self.layers.get('category2', 'int'), 60)
+        self.conf.remove_option('category2', 'int')
+        self.assertEquals(self.layers.which('category2', 'int'), 'system')
+
+    def test_reload(self):
+        UserConfig('testconfig2', OPTIONS2).set('category1', 'float', 1.5)
+        self.assertEquals(self.layers.get('category1', 'float'), 12.3)
+        self.conf.reload()
+        self.assertEquals(self.layers.get('category1', 'float'), 1.5)
+        self.assertEquals(self.layers.which('category1', 'float'), 'user')
+
+    def test_unknown(self):
+        self.assertRaises(RuntimeError, self.layers.get, 'category1', 'foo')
+        self.assertRaises(RuntimeError, self.layers.which, 'category1', 'foo')
+        self.assertEquals(self.layers.get('category1', 'foo', 1), 1)
+
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        self.events = []
+        self.conf = UserConfig('testconfig1', OPTIONS1)
+
+    def tearDown(self):
+        self.conf.cleanup()
+
+    def sink(self, event, key, elapsed, size):
+        self.events.append( (event, key, size) )
+
+    def test_counters(self):
+        conf = self.conf
+        conf.enable_stats(self.sink)
+        conf.get(None, 'category2/int')
+        conf.get('main', 'Category2/Int')
+        conf.get_many([(None, 'category1/float')])
+        conf.set(None, 'category2/int', 1)
+        stats = conf.stats()
+        self.assertEquals(stats['reads'], {('main', 'category2/int'): 2,
+                                           ('main', 'category1/float'): 1})
+        self.assertEquals(stats['writes'], {('main', 'category2/int'): 1})
+        self.assertEquals(stats['saves'], 1)
+        self.assertEquals(stats['bytes_written'],
+                          os.path.getsize(conf.filename()))
+        self.assertEquals(stats['latency']['get']['count'], 2)
+        self.assertEquals(stats['latency']['set']['count'], 1)
+        self.assertEquals([event for event, _key, _size in self.events],
+                          ['get', 'get', 'save', 'set'])
+        conf.reload()
+        self.assertEquals(conf.stats()['loads'], 1)
+
+    def test_decode_failure(self):
+        conf_file = file(self.conf.filename())
+        text = conf_file.read()
+        conf_file.close()
+        conf_file = file(self.conf.filename(), 'w')
+        conf_file.write(text.replace("[5, 'kk']", '[1, 2'))
+        conf_file.close()
+        self.conf.enable_stats(self.sink)
+        self.conf.reload()
+        self.assertEquals(self.conf.get(None, 'category1/list'), '[1, 2')
+        self.assertEquals(self.conf.stats()['decode_failures'],
+                          {('main', 'category1/list'): 1})
+        self.assert_(('decode_error', ('main', 'category1/list'), None)
+                     in self.events)
+
+    def test_disable(self):
+        self.assertEquals(self.conf.stats(), None)
+        self.conf.enable_stats()
+        self.conf.disable_stats()
+        self.assert_('get' not in self.conf.__dict__)
+        self.conf.get(None, 'category2/int')
+        self.assertEquals(self.conf.stats(), None)
+
+
+class TestLowMemory(unittest.TestCase):
+
+    def tearDown(self):
+        UserConfig('testconfig2', {}, load=False).cleanup()
+
+    def test_options(self):
+        defaults = copy_options(OPTIONS2)
+        conf = UserConfig('testconfig2', defaults, low_memory=True)
+        conf.set('category2', 'int', 60)
+        conf.set('category4', 'List', [1, 'kk'])
+        for section in ('category1', 'category2', 'category3'):
+            self.assertEquals(conf.get_section(section),
+                              UserConfig('testconfig2',
+                                         OPTIONS2).get_section(section))
+        conf = UserConfig('testconfig2', defaults, low_memory=True)
+        self.assertEquals(conf.get('category2', 'int'), 60)
+        self.assertEquals(conf.get('category4', 'list'), [1, 'kk'])
+        self.assertEquals(conf.get_cache_info()['size'], 0)
+        self.assertEquals(type(conf._sections['category2']), dict)
+        # Option names are shared with defaults
+        name = [ option for option in conf._sections['category2']
+                 if option == 'int' ][0]
+        self.assert_(name is [ option for option in defaults[1][1]
+                               if option == 'int' ][0])
+
+    def test_reload(self):
+        conf = UserConfig('testconfig2', OPTIONS2, low_memory=True)
+        UserConfig('testconfig2', OPTIONS2).set('category2', 'int', 60)
+        self.assertEquals(conf.reload(conf.read_storage()),
+                          [('category2', 'int')])
+        self.assertEquals(conf.get('category2', 'int'), 60)
+        self.assertEquals(type(conf._sections['category2']), dict)
+
+
+STREAM_TEXT = """# Comment before sections
+[DEFAULT]
+shared = 1
+
+[category1]
+; comment
+float = 1.5 ; inline comment
+list = [1,
+# comment inside value
+  2]
+rem remark
+empty = ""
+
+[category2]
+int: 60
+str = 'text text'
+"""
+
+class TestStream(unittest.TestCase):
+
+    def setUp(self):
+        self.conf = UserConfig('testconfig2', {}, load=False)
+        conf_file = file(self.conf.filename(), 'w')
+        conf_file.write(STREAM_TEXT)
+        conf_file.close()
+
+    def tearDown(self):
+        if os.path.isfile(self.conf.filename()):
+            self.conf.cleanup()
+
+    def test_iter_options(self):
+        parser = RawConfigParser()
+        parser.readfp(StringIO(STREAM_TEXT))
+        options = list(iter_options(StringIO(STREAM_TEXT)))
+        self.assertEquals(options[0], ('DEFAULT', 'shared', '1'))
+        self.assertEquals([ (section, option, value)
+                            for section, option, value in options[1:] ],
+                          [ (section, option,
+                             parser.get(section, option))
+                            for section in parser.sections()
+                            for option in parser.options(section)
+                            if option != 'shared' ])
+
+    def test_patch(self):
+        storage = FileStorage(streaming=True)
+        conf = UserConfig('testconfig2', copy_options(OPTIONS2),
+                          storage=storage)
+        conf.set('category1', 'float', 2.5)
+        conf.set('category4', 'option', 4)
+        conf.remove_option('category2', 'str')
+        conf.save()
+        text = file(conf.filename()).read()
+        for line in ('# Comment before sections', '; comment',
+                     'float = 2.5\n', '[1,\n# comment inside value\n  2]',
+                     'int: 60', '[category4]\noption = 4\n'):
+            self.assert_(line in text, line)
+        self.assert_('str =' not in text)
+        # Missing default option is appended to its section
+        self.assert_('bool = True\n\n[category2]' in text)
+        conf = UserConfig('testconfig2', OPTIONS2)
+        self.assertEquals(conf.get('category1', 'float'), 2.5)
+        self.assertEquals(conf.get('category1', 'list'), [1, 2])
+        self.assertEquals(conf.get('category4', 'option'), 4)
+
+    def test_modified(self):
+        conf = UserConfig('testconfig2', copy_options(OPTIONS2),
+                          storage=FileStorage(streaming=True))
+        UserConfig('testconfig2', OPTIONS2).set('category2', 'int', 70)
+        conf.set('category1', 'float', 2.5)
+        # File modified since loaded: rewritten as a whole
+        text = file(conf.filename()).read()
+        self.assert_('# Comment' not in text)
+        self.assertEquals(UserConfig('testconfig2',
+                                     OPTIONS2).get('category2', 'int'), 60)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -33,40 +33,169 @@ FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR
 OTHER DEALINGS IN THE SOFTWARE.
 """
 
+from __future__ import with_statement
+
 __version__ = '1.0.10'
 __license__ = __doc__
 
-import os, re
+import os, re, time, atexit, weakref
+from StringIO import StringIO
 import os.path as osp
-from ConfigParser import ConfigParser, MissingSectionHeaderError
+from contextlib import contextmanager
+from ConfigParser import (ConfigParser, RawConfigParser,
+                          MissingSectionHeaderError, DEFAULTSECT)
+
+try:
+    import fcntl
+except ImportError:
+    # Inter-process locking is not available (e.g. on Windows)
+    fcntl = None
+
+from codec import LiteralCodec, get_typed_codec
+from schema import Schema, SectionProxy
+from snapshot import get_signature, dump_snapshot, load_snapshot, NoValue
+from storage import (get_home_dir, get_umask, replace_file, fsync_dir,
+                     FSYNC_NONE, FSYNC_FILE, FSYNC_DIR, FileStorage)
+from saver import Saver
+from rwlock import ReadWriteLock
+from stats import Stats, default_timer
+
+
+# Section changes recorded for merge-on-save
+SECTION_ADDED, SECTION_REMOVED, SECTION_REPLACED = 'added', 'removed', 'replaced'
 
+VERSION_PATTERN = re.compile(r'^(\d+).(\d+).(\d+)$')
 
-def get_home_dir():
+def parse_version(version):
     """
-    Return user home directory
+    Return X.Y.Z version number as a tuple of ints (None if invalid)
     """
-    try:
-        path = osp.expanduser('~')
-    except:
-        path = ''
-    for env_var in ('HOME', 'USERPROFILE', 'TMP'):
-        if osp.isdir(path):
-            break
-        path = os.environ.get(env_var, '')
-    if path:
-        return path
-    else:
-        raise RuntimeError('Please define environment variable $HOME')
+    if isinstance(version, (str, unicode)):
+        match = VERSION_PATTERN.match(version)
+        if match is not None:
+            return tuple([int(number) for number in match.groups()])
 
 class NoDefault:
     pass
 
+class NoCache(dict):
+    """
+    Decoded values cache which keeps nothing (see 'low_memory' argument)
+    """
+    def __setitem__(self, key, value):
+        pass
+
+# Values which are not longer than this are interned in low memory mode
+# (section and option names always are)
+INTERNED_VALUE_SIZE = 32
+
+def intern_string(text, max_size=None):
+    """
+    Return interned text if it is a str (not longer than max_size)
+    """
+    if type(text) is str and (max_size is None or len(text) <= max_size):
+        return intern(text)
+    return text
+
+# Types of decoded values copied when returned (see 'copy_value')
+MUTABLE_TYPES = (list, dict, set, tuple)
+
+def copy_value(value):
+    """
+    Return a copy of a mutable decoded value (lists, dictionnaries, sets,
+    and tuples containing them are copied recursively), so that changing
+    it in place does not change cached values; other values are returned
+    as is
+    """
+    value_type = type(value)
+    if value_type is list:
+        return [ copy_value(item) for item in value ]
+    elif value_type is dict:
+        return dict([ (key, copy_value(item))
+                      for key, item in value.iteritems() ])
+    elif value_type is set:
+        return set(value)
+    elif value_type is tuple:
+        for item in value:
+            if type(item) in MUTABLE_TYPES:
+                return tuple([ copy_value(item) for item in value ])
+    return value
+
+def flush_at_exit(config_ref):
+    """
+    Write changes pending in config background saver (see 'save_delay')
+    when the process exits (config_ref: weak reference to config)
+    """
+    config = config_ref()
+    if config is not None:
+        config.close()
+
 class UserConfig(ConfigParser):
     """
     UserConfig class, based on ConfigParser
     name: name of the config
     options: dictionnary containing options
              *or* list of tuples (section_name, options)
+             *or* Schema instance (compiled options, see 'schema' module:
+             sections are then also available as attributes, e.g.
+             config.Font.size)
+    codec: codec used for options which are neither bool, int nor float
+           (default: LiteralCodec, i.e. Python literals parsed without eval)
+    lazy: if True, setting default options and loading (and upgrading)
+          the .ini file are deferred until options are accessed for the
+          first time (get, set, items, ...)
+    fsync: the .ini file is written to a temporary file which is then
+           renamed, so that it is never left half-written; fsync policy:
+           FSYNC_NONE ('none', default): rely on the OS to flush data
+           FSYNC_FILE ('file'): flush the temporary file before renaming
+             (protects file contents against power failures; costs a disk
+              sync per save: from ~1 ms on SSDs to tens of ms on HDD/NFS)
+           FSYNC_DIR ('dir'): also flush the directory after renaming
+             (makes the rename itself durable; about twice FSYNC_FILE cost)
+    lock: if True, the .ini file is read (resp. written) while holding
+          a shared (resp. exclusive) advisory lock on a '.lock' file,
+          for processes sharing the same config (requires fcntl)
+    merge: if True (implies lock=True), the .ini file is read again
+           when saving and only options changed by this process are
+           written back, so that concurrent processes don't overwrite
+           each other's changes
+    auto_reload: if not None, minimum interval (in seconds) between two
+                 checks of the .ini file modification time, size and inode
+                 (done when getting options): the file is read again
+                 (see 'reload' method) when it has been modified, unless
+                 config has unsaved changes or a batch is running
+    reload_callback: function called as reload_callback(config, changed)
+                     when options have been reloaded, 'changed' being the
+                     list of (section, option) whose value changed
+    migrations: dictionnary {version: list of migration steps} (see
+                'migration' module): when version has changed, instead of
+                resetting config to defaults, steps of versions newer than
+                .ini file version (up to 'version') are applied in order,
+                keeping user settings
+    snapshot_cache: if True, parsed options and their decoded values are
+                    cached in a binary '.cache' file next to the .ini file,
+                    which is used instead of parsing the .ini file again
+                    as long as its modification time, size and hash match
+                    (requires a FileStorage)
+    storage: storage backend (see 'storage' module), default: FileStorage,
+             i.e. '.<name>.ini' file in user home directory
+             (MemoryStorage: in-memory options, SQLiteStorage: SQLite
+              database in which only changed options are written)
+    save_delay: if not None, config is saved by a background thread
+                save_delay seconds (at most) after it has changed, changes
+                made meanwhile being written together, so that 'set' does
+                not wait for storage; see 'flush' and 'close' methods
+                (pending changes are also written when the process exits)
+    thread_safe: if True, config may be shared by several threads: methods
+                 changing config hold an exclusive lock, methods reading it
+                 a shared lock, and cached decoded values (see 'get') are
+                 read without locking
+    low_memory: if True, options take less memory (configs with hundreds
+                of thousands of options): section and option names (and
+                short values) are interned, option names being shared with
+                defaults, sections are plain dictionnaries (options order
+                is not kept in the .ini file) and decoded values are not
+                cached (options are decoded on each 'get')
     
     Note that 'get' and 'set' arguments number and type
     differ from the overriden methods
@@ -74,30 +203,238 @@ class UserConfig(ConfigParser):
     
     default_section_name = 'main'
     
-    def __init__(self, name, defaults=None, load=True, version=None):
+    def __init__(self, name, defaults=None, load=True, version=None,
+                 codec=None, lazy=False, fsync=FSYNC_NONE, lock=False,
+                 merge=False, auto_reload=None, reload_callback=None,
+                 migrations=None, snapshot_cache=False, storage=None,
+                 save_delay=None, thread_safe=False, low_memory=False):
         ConfigParser.__init__(self)
-        if (version is not None) and (re.match('^(\d+).(\d+).(\d+)$', version) is None):
+        self.low_memory = low_memory
+        if low_memory:
+            self._dict = dict
+            self._sections, self._defaults = {}, {}
+            self.optionxform = self.__intern_optionxform
+        if fsync not in (FSYNC_NONE, FSYNC_FILE, FSYNC_DIR):
+            raise RuntimeError("Unknown fsync policy %r" % fsync)
+        self.fsync = fsync
+        if storage is None:
+            storage = FileStorage()
+        storage.attach(name)
+        self.storage = storage
+        self.lock = lock or merge
+        self.merge = merge
+        if self.lock and fcntl is None:
+            raise RuntimeError("File locking is not supported on this platform")
+        if self.lock and storage.filename is None:
+            raise RuntimeError("File locking requires a storage with a filename")
+        if merge and save_delay is not None:
+            raise RuntimeError("Merge mode does not support background saving")
+        self.save_delay = save_delay
+        self._saver = None
+        # Options copies submitted to the background saver, by section
+        # (sections which did not change since are not copied again)
+        self._submitted = None
+        if snapshot_cache and (not isinstance(storage, FileStorage)
+                               or storage.journal or storage.streaming):
+            raise RuntimeError("Snapshot cache requires a FileStorage "
+                               "without journal or streaming")
+        # Changes since last save: (section, option) -> value, NoDefault
+        # (removed option), and (section, None) -> SECTION_* constants
+        # (also written as is by incremental storage backends)
+        self._changes = None
+        if merge or storage.incremental or save_delay is not None:
+            self._changes = {}
+        self._full_save = False
+        self.schema = None
+        self._specs = {}
+        if isinstance(defaults, Schema):
+            self.schema = defaults
+            self._specs = defaults.specs
+            defaults = defaults.defaults
+            if codec is None:
+                codec = self.schema.codec
+        if codec is None:
+            codec = LiteralCodec()
+        self.codec = codec
+        self.auto_reload = auto_reload
+        self.snapshot_cache = snapshot_cache
+        self.reload_callback = reload_callback
+        self._file_stat = None
+        self._next_check = 0
+        self._batch_level = 0
+        self._save_pending = False
+        self._subscribers = {}
+        self._notifications = {}
+        self._notify_level = 0
+        self._dirty = False
+        self._decoded = {}
+        if low_memory:
+            self._decoded = NoCache()
+        self._cache_hits = self._cache_misses = 0
+        self._lazy_args = None
+        self._rwlock = None
+        self._stats = None
+        self._timed_methods = None
+        if (version is not None) and (parse_version(version) is None):
             raise RuntimeError("Version number %r is incorrect - must be in X.Y.Z format" % version)
+        if migrations is not None:
+            for step_version in migrations:
+                if parse_version(step_version) is None:
+                    raise RuntimeError("Migration version number %r is incorrect - must be in X.Y.Z format" % step_version)
+        self.migrations = migrations
         self.name = name
         if isinstance(defaults, dict):
             defaults = [ (self.default_section_name, defaults) ]
         self.defaults = defaults
-        if defaults is not None:
-            self.reset_to_defaults(save=False)
+        self.__index_defaults()
+        if lazy:
+            self._lazy_args = (load, version)
+        else:
+            self.__initialize(load, version)
+        if thread_safe:
+            self._rwlock = ReadWriteLock()
+            self.__make_thread_safe()
+
+    # Methods holding the shared (resp. exclusive) lock in thread-safe mode
+    reading_methods = ('get_section', 'get_many', 'get_default', 'items',
+                       'options', 'sections', 'has_option', 'has_section',
+                       'write')
+    writing_methods = ('set', 'update', 'set_section', 'set_default',
+                       'remove_option', 'remove_section', 'add_section',
+                       'reset_to_defaults', 'set_as_defaults', 'reload',
+                       'save', 'compact', 'close', 'cleanup', 'subscribe',
+                       'unsubscribe', 'read', 'readfp')
+
+    def __make_thread_safe(self):
+        """
+        Private method replacing public methods by methods holding the
+        reader/writer lock (see 'thread_safe' constructor argument)
+        """
+        lock = self._rwlock
+        def reading(method):
+            def locked(*args, **kwargs):
+                self.__prepare_read()
+                lock.acquire_read()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    lock.release_read()
+            return locked
+        def writing(method):
+            def locked(*args, **kwargs):
+                lock.acquire_write()
+                try:
+                    return method(*args, **kwargs)
+                finally:
+                    lock.release_write()
+            return locked
+        for name in self.reading_methods:
+            setattr(self, name, reading(getattr(self, name)))
+        for name in self.writing_methods:
+            setattr(self, name, writing(getattr(self, name)))
+        get, batch = self.get, self.batch
+        def locked_get(section, option, default=NoDefault):
+            self.__prepare_read()
+            if section is None:
+                section = self.default_section_name
+            try:
+                value = self._decoded[(section, self.optionxform(option))]
+            except (KeyError, TypeError, AttributeError):
+                pass
+            else:
+                self._cache_hits += 1
+                if type(value) in MUTABLE_TYPES:
+                    return copy_value(value)
+                return value
+            lock.acquire_read()
+            try:
+                try:
+                    return get(section, option)
+                except RuntimeError:
+                    # Missing option: default value has to be set
+                    if default is NoDefault:
+                        raise
+            finally:
+                lock.release_read()
+            lock.acquire_write()
+            try:
+                return get(section, option, default)
+            finally:
+                lock.release_write()
+        @contextmanager
+        def locked_batch():
+            lock.acquire_write()
+            try:
+                with batch():
+                    yield self
+            finally:
+                lock.release_write()
+        self.get, self.batch = locked_get, locked_batch
+
+    def __prepare_read(self):
+        """
+        Private method loading config (lazy mode) or reloading it (see
+        'auto_reload'), if needed, before acquiring the read lock
+        (nothing is done if the calling thread already holds it: the write
+        lock can't be acquired then)
+        """
+        if self._rwlock.is_reader():
+            return
+        if self._lazy_args is not None or (self.auto_reload is not None and
+                                           time.time() >= self._next_check):
+            self._rwlock.acquire_write()
+            try:
+                self.__ensure_loaded()
+                if self.auto_reload is not None:
+                    self.__check_reload()
+            finally:
+                self._rwlock.release_write()
+
+    def __getattr__(self, name):
+        """
+        Return an attribute-style accessor to schema sections options
+        """
+        schema = self.__dict__.get('schema')
+        if schema is not None and name in schema.sections:
+            return SectionProxy(self, name)
+        raise AttributeError("%r object has no attribute %r"
+                             % (self.__class__.__name__, name))
+
+    def __initialize(self, load, version):
+        """
+        Set default options, load config file (if load is True),
+        upgrade it if version has changed and save it
+        """
+        self._lazy_args = None
         if load:
             # If config file already exists, it overrides Default options:
             self.__load()
-            if version != self.get_version(version):
-                # Version has changed -> overwriting .ini file
-                self.reset_to_defaults(save=False)
+            if self.defaults is not None:
+                self.__set_missing_defaults()
+            old_version = self.get_version(version)
+            if version != old_version:
+                if self.migrations is None:
+                    # Version has changed -> overwriting .ini file
+                    self.reset_to_defaults(save=False)
+                else:
+                    self.__migrate(old_version, version)
                 self.__remove_deprecated_options()
                 # Set new version number
                 self.set_version(version, save=False)
-            if defaults is None:
+            if self.defaults is None:
                 # If no defaults are defined, set .ini file settings as default
                 self.set_as_defaults()
-        # In any case, the resulting config is saved in config file:
+        elif self.defaults is not None:
+            self.reset_to_defaults(save=False)
+        # The resulting config is saved in config file (if it has changed):
         self.__save()
+
+    def __ensure_loaded(self):
+        """
+        Private method loading the config file if it was deferred (lazy mode)
+        """
+        if self._lazy_args is not None:
+            self.__initialize(*self._lazy_args)
         
     def get_version(self, version='0.0.0'):
         """Return configuration (not application!) version"""
@@ -111,63 +448,648 @@ class UserConfig(ConfigParser):
         """
         Load config from the associated .ini file
         """
+        self._submitted = None
+        if self._stats is not None:
+            start = default_timer()
+        lock_file = self.__lock(exclusive=False)
         try:
-            self.read(self.filename())
+            self._file_stat = self.__stat_file()
+            try:
+                # A missing file has to be created
+                if self.snapshot_cache:
+                    self._dirty = not self.__load_snapshot()
+                else:
+                    self._decoded.clear()
+                    self._dirty = not self.storage.load(self)
+            except MissingSectionHeaderError:
+                print "Warning: File contains no section headers."
+                self._dirty = True
+            if self.low_memory:
+                self.__intern_options()
+            # Nothing (valid) is stored yet: the whole config has to be saved
+            self._full_save = self._dirty
+        finally:
+            self.__unlock(lock_file)
+        if self._stats is not None:
+            self._stats.loaded(default_timer()-start)
+
+    def __intern_optionxform(self, optionstr):
+        """
+        Private optionxform method interning option names (low memory mode)
+        """
+        return intern_string(optionstr.lower())
+
+    def __intern_options(self):
+        """
+        Private method interning names and short values of loaded options,
+        stored in plain dictionnaries (low memory mode)
+        """
+        sections = {}
+        for section, options in self._sections.iteritems():
+            sections[intern_string(section)] = dict([
+                (intern_string(option),
+                 intern_string(value, INTERNED_VALUE_SIZE))
+                for option, value in options.iteritems() ])
+        self._sections = sections
+        self._defaults = dict(self._defaults)
+
+    def __stat_file(self):
+        """
+        Return (modification time, size, inode) of the .ini file
+        (None if it does not exist), or storage-specific equivalent
+        """
+        return self.storage.stat()
+
+    def __check_reload(self):
+        """
+        Reload the .ini file if it has been modified since it was loaded
+        or saved (checked at most once every 'auto_reload' seconds)
+        Nothing is done while config has unsaved changes, or within a
+        batch: reloading would discard them (they are saved, and other
+        processes changes overwritten, as without auto_reload)
+        """
+        if self._rwlock is not None and not self._rwlock.is_writer():
+            # Thread-safe mode: checked before acquiring the read lock
+            return
+        if self._dirty or self._batch_level:
+            return
+        now = time.time()
+        if now >= self._next_check:
+            self._next_check = now + self.auto_reload
+            if self.__stat_file() != self._file_stat:
+                self.reload()
+
+    def read_storage(self):
+        """
+        Read stored options without changing config (so that it may be
+        called from another thread, see 'reload'): return a RawConfigParser
+        whose attribute 'exists' is False if nothing is stored, and 'stat'
+        is storage state (see 'auto_reload' constructor argument)
+        """
+        stored = RawConfigParser()
+        lock_file = self.__lock(exclusive=False)
+        try:
+            stored.stat = self.__stat_file()
+            try:
+                stored.exists = self.storage.load(stored)
+            except MissingSectionHeaderError:
+                print "Warning: File contains no section headers."
+                stored.exists = False
+        finally:
+            self.__unlock(lock_file)
+        return stored
+
+    def reload(self, stored=None):
+        """
+        Read the .ini file again, discarding unsaved changes
+        stored: options returned by 'read_storage' (default: read now)
+        Return the list of (section, option) whose value changed
+        """
+        self.__ensure_loaded()
+        if stored is None:
+            self.flush()
+        old_sections = self.__snapshot()[0]
+        notifications = self._notifications.copy()
+        self.__begin_changes()
+        try:
+            self._sections = self._dict()
+            if self._changes is not None:
+                self._changes.clear()
+            if stored is None:
+                self.__load()
+            else:
+                self._submitted = None
+                self._decoded.clear()
+                self._sections = stored._sections
+                self._defaults = stored._defaults
+                self._file_stat = stored.stat
+                self._dirty = self._full_save = not stored.exists
+                if self.low_memory:
+                    self.__intern_options()
+            if self.defaults is not None:
+                self.__set_missing_defaults()
+            changed = self.__changed_options(old_sections)
+            if self._subscribers:
+                for section, option in changed:
+                    old_value = old_sections.get(section, {}).get(option,
+                                                                  NoDefault)
+                    self._notifications[(section, option)] = \
+                        notifications.get((section, option), old_value)
+        finally:
+            self.__end_changes()
+        if changed and self.reload_callback is not None:
+            self.reload_callback(self, changed)
+        return changed
+
+    def __changed_options(self, old_sections):
+        """
+        Return the list of (section, option) whose value is different
+        in old_sections (as returned by __snapshot) and current config
+        """
+        changed = []
+        for section, options in self._sections.iteritems():
+            old_options = old_sections.get(section, {})
+            for option, value in options.iteritems():
+                if option != '__name__' and \
+                   old_options.get(option, NoDefault) != value:
+                    changed.append( (section, option) )
+        for section, old_options in old_sections.iteritems():
+            options = self._sections.get(section, {})
+            for option in old_options:
+                if option != '__name__' and option not in options:
+                    changed.append( (section, option) )
+        return changed
+
+    def __lock(self, exclusive):
+        """
+        Acquire the inter-process lock (if enabled): return the lock file
+        """
+        if not self.lock:
+            return
+        lock_file = file(self.filename()+'.lock', 'a')
+        if exclusive:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_SH)
+        return lock_file
+
+    def __unlock(self, lock_file):
+        """
+        Release the inter-process lock acquired by __lock
+        """
+        if lock_file is not None:
+            lock_file.close()
+
+    def __merge(self):
+        """
+        Read the .ini file again and apply the changes made since last save
+        (called while holding the exclusive inter-process lock)
+        """
+        changes, self._changes = self._changes, None
+        old_sections = self._sections
+        self._sections = self._dict()
+        self._decoded.clear()
+        try:
+            self.storage.load(self)
         except MissingSectionHeaderError:
-            print "Warning: File contains no section headers."
+            pass
+        for (section, option), value in changes.iteritems():
+            if option is not None:
+                continue
+            if value in (SECTION_REMOVED, SECTION_REPLACED):
+                ConfigParser.remove_section(self, section)
+            if value != SECTION_REMOVED and not self.has_section(section):
+                ConfigParser.add_section(self, section)
+        for (section, option), value in changes.iteritems():
+            if option is None:
+                continue
+            if value is NoDefault:
+                if self.has_section(section):
+                    ConfigParser.remove_option(self, section, option)
+            else:
+                if not self.has_section(section):
+                    ConfigParser.add_section(self, section)
+                ConfigParser.set(self, section, option, value)
+        self._changes = {}
+        if self._subscribers:
+            # Notify options changed by other processes
+            for section, option in self.__changed_options(old_sections):
+                old_options = old_sections.get(section, {})
+                self.__record_change(section, option,
+                                     old_options.get(option, NoDefault))
+
+    def __load_snapshot(self):
+        """
+        Load config from the snapshot cache if it matches the .ini file,
+        otherwise parse the .ini file and write the snapshot cache
+        Return False if the .ini file does not exist
+        """
+        filename = self.filename()
+        try:
+            ini_file = file(filename, 'rb')
+            try:
+                data = ini_file.read()
+            finally:
+                ini_file.close()
+        except IOError:
+            return False
+        signature = get_signature(data, self._file_stat[0])
+        entries = load_snapshot(filename+'.cache', signature)
+        if entries is not None:
+            self.__restore_snapshot(entries)
+            return True
+        self.readfp(StringIO(data), filename)
+        entries = []
+        for option, value in self._defaults.iteritems():
+            entries.append( (DEFAULTSECT, option, value, None, NoValue) )
+        for section, options in self._sections.iteritems():
+            for option, value in options.iteritems():
+                if option == '__name__':
+                    continue
+                codec = self.__get_option_codec(section, option)
+                decoded = NoValue
+                if '%' not in value:
+                    try:
+                        decoded = self.__get_decoded(section, option)
+                    except ValueError:
+                        pass
+                entries.append( (section, option, value, codec.name,
+                                 decoded) )
+        try:
+            dump_snapshot(filename+'.cache', signature, entries)
+        except (IOError, OSError):
+            pass
+        return True
+
+    def __restore_snapshot(self, entries):
+        """
+        Restore options (and decoded values) from snapshot cache entries
+        """
+        self._decoded.clear()
+        sections = self._sections
+        for section, option, value, codec_name, decoded in entries:
+            if section == DEFAULTSECT:
+                self._defaults[option] = value
+                continue
+            options = sections.get(section)
+            if options is None:
+                options = sections[section] = self._dict()
+                options['__name__'] = section
+            options[option] = value
+            if decoded is not NoValue and codec_name is not None and \
+               codec_name == self.__get_option_codec(section, option).name:
+                self._decoded[(section, option)] = decoded
+
+    def __set_missing_defaults(self):
+        """
+        Set default values of options which are not in the loaded .ini file
+        """
+        for section, options in self.defaults:
+            for option in options:
+                if not self.has_option(section, option):
+                    self.__set(section, option, options[ option ], False)
         
     def __remove_deprecated_options(self):
         """
         Remove options which are present in the .ini file but not in defaults
         """
         for section in self.sections():
-            for option, _ in self.items(section):
-                if self.get_default(section, option) is NoDefault:
-                    self.remove_option(section, option)
-                    if len(self.items(section)) == 0:
-                        self.remove_section(section)
-        
+            options = self._sections[section]
+            deprecated = [ option for option in options
+                           if option != '__name__' and
+                           self.__get_default(section, option) is NoDefault ]
+            for option in deprecated:
+                self.remove_option(section, option)
+            if deprecated and len(options) == ('__name__' in options):
+                self.remove_section(section)
+
+    def __migrate(self, old_version, version):
+        """
+        Apply migration steps from old_version (excluded) to version
+        """
+        old_version = parse_version(old_version) or (0, 0, 0)
+        version = parse_version(version)
+        steps = [ (parse_version(step_version), steps)
+                  for step_version, steps in self.migrations.items() ]
+        steps.sort()
+        for step_version, steps in steps:
+            if old_version < step_version <= version:
+                for step in steps:
+                    self.__apply_migration_step(step)
+
+    def __apply_migration_step(self, step):
+        """
+        Apply a migration step (see 'migration' module) to loaded options
+        """
+        section = self.__check_section_option(step.section, '')
+        if step.kind == 'move_section':
+            if self.has_section(section):
+                new_section = self.__check_section_option(step.new_section, '')
+                for option, value in self._sections[section].items():
+                    if option != '__name__':
+                        self.__set(new_section, option, value, False)
+                self.remove_section(section)
+        elif step.kind == 'drop' and step.option is None:
+            self.remove_section(section)
+        elif self.has_option(section, step.option):
+            option = self.optionxform(step.option)
+            value = self._sections[section][option]
+            if step.kind == 'rename':
+                new_section = self.__check_section_option(step.new_section,
+                                                          step.new_option)
+                self.remove_option(section, option)
+                self.__set(new_section, step.new_option, value, False)
+            elif step.kind == 'transform':
+                value = step.function(self.__decode(section, option, value))
+                default_value = self.__get_default(section, option)
+                if default_value is NoDefault:
+                    default_value = value
+                value = self.__get_codec(default_value).encode(value)
+                self.__set(section, option, value, False)
+            elif step.kind == 'drop':
+                self.remove_option(section, option)
+            else:
+                raise RuntimeError("Unknown migration step %r" % step)
+
     def __save(self):
         """
         Save config into the associated .ini file
+        (deferred until the end of the current batch, if any)
+        The file is replaced atomically: see 'fsync' constructor argument
+        """
+        if self._batch_level:
+            self._save_pending = True
+            return
+        self._save_pending = False
+        if not self._dirty:
+            return
+        if self.save_delay is not None:
+            self.__submit_save()
+            return
+        start = default_timer()
+        lock_file = self.__lock(exclusive=True)
+        try:
+            changes = self.__storage_changes()
+            if self.merge:
+                self.__merge()
+            size = self.storage.save(self, changes)
+            self._file_stat = self.__stat_file()
+        finally:
+            self.__unlock(lock_file)
+        if self._stats is not None:
+            self._stats.saved(default_timer()-start, size)
+        self._dirty = self._full_save = False
+        if self._changes is not None:
+            self._changes.clear()
+
+    def __submit_save(self):
+        """
+        Private method scheduling the save of a copy of config options
+        by the background saver (see 'save_delay' constructor argument)
+        """
+        submitted = self._submitted or {}
+        changed = set([section for section, _option in self._changes])
+        snapshot = RawConfigParser()
+        snapshot._defaults = self._defaults.copy()
+        snapshot._sections = self._dict()
+        for section, options in self._sections.iteritems():
+            if section in changed or section not in submitted:
+                options = options.copy()
+            else:
+                options = submitted[section]
+            snapshot._sections[section] = options
+        self._submitted = snapshot._sections
+        snapshot.fsync = self.fsync
+        changes = self.__storage_changes()
+        if self._saver is None:
+            self._saver = Saver(self.__save_snapshot, self.save_delay)
+            atexit.register(flush_at_exit, weakref.ref(self))
+        self._saver.submit(snapshot, changes)
+        self._dirty = self._full_save = False
+        if self._changes is not None:
+            self._changes.clear()
+
+    def __save_snapshot(self, snapshot, changes):
+        """
+        Private method saving a copy of config options (saver thread)
+        """
+        start = default_timer()
+        lock_file = self.__lock(exclusive=True)
+        try:
+            size = self.storage.save(snapshot, changes)
+            self._file_stat = self.__stat_file()
+        finally:
+            self.__unlock(lock_file)
+        if self._stats is not None:
+            self._stats.saved(default_timer()-start, size)
+
+    def flush(self):
+        """
+        Wait until changes pending in the background saver are written
+        (see 'save_delay' constructor argument)
+        """
+        if self._saver is not None:
+            self._saver.flush()
+
+    def __storage_changes(self):
+        """
+        Return changes since last save as expected by incremental storage
+        backends: list of (section, option, value), option being None for
+        a removed (value None) or added (value '') section and value None
+        for a removed option (None if the whole config has to be saved)
+        """
+        if not self.storage.incremental or self._full_save:
+            return
+        changes = []
+        for (section, option), value in self._changes.iteritems():
+            if option is not None:
+                continue
+            if value in (SECTION_REMOVED, SECTION_REPLACED):
+                changes.append( (section, None, None) )
+            if value in (SECTION_ADDED, SECTION_REPLACED):
+                changes.append( (section, None, '') )
+        for (section, option), value in self._changes.iteritems():
+            if option is not None:
+                if value is NoDefault:
+                    value = None
+                changes.append( (section, option, value) )
+        return changes
+
+    def save(self):
+        """
+        Save config if it has changed (e.g. options set with save=False)
+        """
+        self.__ensure_loaded()
+        self.__save()
+
+    def has_unsaved_changes(self):
+        """
+        Return True if the config has changed since it was loaded or saved
+        (or if changes have not been written by the background saver yet)
+        """
+        if self._saver is not None and self._saver.is_pending():
+            return True
+        return self._dirty
+
+    def __snapshot(self):
+        """
+        Return a copy of the in-memory state (options, defaults and changes)
+        """
+        sections = self._dict()
+        for section, options in self._sections.items():
+            sections[section] = options.copy()
+        defaults = self.defaults
+        if defaults is not None:
+            # Defaults dictionnaries are restored in place: keep them
+            defaults = [(sec, options, options.copy())
+                        for sec, options in defaults]
+        changes = self._changes
+        if changes is not None:
+            changes = changes.copy()
+        return sections, defaults, changes, self._dirty
+
+    def __restore(self, state):
+        """
+        Restore in-memory state returned by __snapshot
+        """
+        self._sections, defaults, self._changes, self._dirty = state
+        self._submitted = None
+        if defaults is not None:
+            for _sec, options, copy in defaults:
+                options.clear()
+                options.update(copy)
+            defaults = [(sec, options) for sec, options, _copy in defaults]
+        self.defaults = defaults
+        self.__index_defaults()
+        self._decoded.clear()
+
+    @contextmanager
+    def batch(self):
+        """
+        Group several changes so that the .ini file is written only once,
+        when leaving the outermost block:
+            with conf.batch():
+                conf.set('Font', 'size', 12)
+                conf.set('Font', 'weight', 'normal')
+        If an exception is raised inside the block, the in-memory changes
+        made inside the block are rolled back and nothing is saved
         """
-        conf_file = file(self.filename(),'w')
-        self.write(conf_file)
-        conf_file.close()
+        self.__ensure_loaded()
+        state = self.__snapshot()
+        self._batch_level += 1
+        self.__begin_changes()
+        try:
+            try:
+                yield self
+            except:
+                self._batch_level -= 1
+                self.__restore(state)
+                if self._batch_level == 0:
+                    self._save_pending = False
+                raise
+            self._batch_level -= 1
+            if self._batch_level == 0 and self._save_pending:
+                self.__save()
+        finally:
+            self.__end_changes()
 
     def filename(self):
         """
-        Create a .ini filename located in user home directory
+        Return the storage filename: by default, a .ini filename located
+        in user home directory (None for an in-memory storage)
         """
-        return osp.join(get_home_dir(), '.%s.ini' % self.name)
+        return self.storage.filename
         
+    def compact(self):
+        """
+        Write the whole config in a compact form if the storage supports it
+        (e.g. apply FileStorage journal to the .ini file), saving unsaved
+        changes too
+        """
+        if self._lazy_args is not None or self._batch_level:
+            return
+        self.flush()
+        if not self.storage.compactable:
+            # Only unsaved changes have to be written
+            self.__save()
+            self.flush()
+            return
+        lock_file = self.__lock(exclusive=True)
+        try:
+            if self.merge:
+                self.__merge()
+            compacted = self.storage.compact(self)
+            if compacted:
+                self._file_stat = self.__stat_file()
+        finally:
+            self.__unlock(lock_file)
+        if compacted:
+            self._dirty = self._full_save = False
+            if self._changes is not None:
+                self._changes.clear()
+
+    def close(self):
+        """
+        Write pending changes, compact stored config (see 'compact'),
+        stop the background saver and release storage resources
+        """
+        self.compact()
+        if self._saver is not None:
+            self._saver.stop()
+            self._saver = None
+        self.storage.close()
+
     def cleanup(self):
         """
-        Remove .ini file associated to config
+        Remove .ini file (or other stored data) associated to config
         """
-        os.remove(self.filename())
+        if self._saver is not None:
+            self._saver.stop()
+            self._saver = None
+        self.storage.remove()
+        filename = self.filename()
+        if filename is not None:
+            for extension in ('.lock', '.cache'):
+                if osp.isfile(filename+extension):
+                    os.remove(filename+extension)
+
+    def __index_defaults(self):
+        """
+        Build the section -> options dictionnary index of defaults
+        (options dictionnaries are shared with self.defaults, except for
+         sections listed more than once: their options are merged in a
+         new dictionnary, the first occurence of an option being kept)
+        """
+        index = self._default_index = {}
+        # Sections listed more than once in defaults
+        self._merged_sections = set()
+        if self.defaults is not None:
+            for section, options in self.defaults:
+                if self.low_memory:
+                    # Option names shared with options (see optionxform)
+                    names = [ (intern_string(option), value)
+                              for option, value in options.iteritems() ]
+                    options.clear()
+                    options.update(names)
+                if section not in index:
+                    index[section] = options
+                    continue
+                if section not in self._merged_sections:
+                    self._merged_sections.add(section)
+                    index[section] = index[section].copy()
+                merged = index[section]
+                for option, value in options.iteritems():
+                    merged.setdefault(option, value)
 
     def set_as_defaults(self):
         """
         Set defaults from the current config
         """
+        self.__ensure_loaded()
         self.defaults = []
         for section in self.sections():
             secdict = {}
             for option, value in self.items(section):
                 secdict[option] = value
             self.defaults.append( (section, secdict) )
+        self.__index_defaults()
+        self._decoded.clear()
 
     def reset_to_defaults(self, save=True, verbose=False):
         """
         Reset config to Default values
         """
-        for section, options in self.defaults:
-            for option in options:
-                value = options[ option ]
-                self.__set(section, option, value, verbose)
-        if save:
-            self.__save()
+        self.__ensure_loaded()
+        self.__begin_changes()
+        try:
+            for section, options in self.defaults:
+                for option in options:
+                    value = options[ option ]
+                    self.__set(section, option, value, verbose)
+            if save:
+                self.__save()
+        finally:
+            self.__end_changes()
         
     def __check_section_option(self, section, option):
         """
@@ -181,18 +1103,32 @@ class UserConfig(ConfigParser):
             raise RuntimeError, "Argument 'option' must be a string"
         return section
 
+    def __get_codec(self, default_value):
+        """
+        Private method returning the codec associated to a default value
+        """
+        return get_typed_codec(default_value) or self.codec
+
     def get_default(self, section, option):
         """
         Get Default value for a given (section, option)
         -> useful for type checking in 'get' method
         """
+        return self.__get_default(section, option)
+
+    def __get_default(self, section, option):
+        """
+        Private method returning the default value of an option (see
+        'get_default'), never locked in thread-safe mode
+        """
         section = self.__check_section_option(section, option)
-        for sec, options in self.defaults:
-            if sec == section:
-                if option in options:
-                    return options[ option ]
-        else:
-            return NoDefault
+        if self.defaults is None:
+            # Defaults are read from the config file
+            self.__ensure_loaded()
+        options = self._default_index.get(section)
+        if options is not None and option in options:
+            return options[ option ]
+        return NoDefault
                 
     def get(self, section, option, default=NoDefault):
         """
@@ -200,8 +1136,24 @@ class UserConfig(ConfigParser):
         section=None: attribute a default section name
         default: default value (if not specified, an exception
         will be raised if option doesn't exist)
+        Mutable values (e.g. lists) are returned as copies: changing them
+        does not change config, 'set' has to be called
         """
+        if self._lazy_args is not None:
+            self.__ensure_loaded()
+        if self.auto_reload is not None:
+            self.__check_reload()
         section = self.__check_section_option(section, option)
+        key = (section, self.optionxform(option))
+        try:
+            value = self._decoded[key]
+        except KeyError:
+            self._cache_misses += 1
+        else:
+            self._cache_hits += 1
+            if type(value) in MUTABLE_TYPES:
+                return copy_value(value)
+            return value
 
         if not self.has_section(section):
             if default is NoDefault:
@@ -216,33 +1168,443 @@ class UserConfig(ConfigParser):
                 self.set(section, option, default)
                 return default
             
-        value = ConfigParser.get(self, section, option)
-        default_value = self.get_default(section, option)
-        if isinstance(default_value, bool):
-            value = eval(value)
-        elif isinstance(default_value, float):
-            value = float(value)
-        elif isinstance(default_value, int):
-            value = int(value)
-        else:
+        text = ConfigParser.get(self, section, option, raw=True)
+        if '%' in text:
+            # Interpolated values depend on other options: not cached
+            return self.__decode(section, option,
+                                 ConfigParser.get(self, section, option))
+        value = self.__decode(section, option, text)
+        self._decoded[key] = value
+        if type(value) in MUTABLE_TYPES:
+            return copy_value(value)
+        return value
+
+    def get_section(self, section):
+        """
+        Return a dictionnary containing decoded values of all options
+        of a section (faster than calling 'get' for each option)
+        section=None: attribute a default section name
+        """
+        self.__ensure_loaded()
+        if self.auto_reload is not None:
+            self.__check_reload()
+        section = self.__check_section_option(section, '')
+        if not self.has_section(section):
+            raise RuntimeError("Unknown section %r" % section)
+        decoded = self._decoded
+        values = {}
+        for option in self._sections[section]:
             try:
-                # lists, tuples, ...
-                value = eval(value)
-            except:
+                values[option] = decoded[(section, option)]
+            except KeyError:
+                if option != '__name__':
+                    values[option] = self.__get_decoded(section, option)
+        for option in self._defaults:
+            if option not in values:
+                values[option] = self.__get_decoded(section, option)
+        for option, value in values.iteritems():
+            if type(value) in MUTABLE_TYPES:
+                values[option] = copy_value(value)
+        self._cache_hits += len(values)
+        if self._stats is not None:
+            for option in values:
+                self._stats.read((section, option))
+        return values
+
+    def get_many(self, keys):
+        """
+        Return a dictionnary containing decoded values of options
+        keys: list of (section, option) -- which are also the keys of
+              the returned dictionnary (section=None: default section)
+        """
+        self.__ensure_loaded()
+        if self.auto_reload is not None:
+            self.__check_reload()
+        decoded = self._decoded
+        optionxform = self.optionxform
+        default_section = self.default_section_name
+        values = {}
+        for key in keys:
+            section, option = key
+            if section is None:
+                section = default_section
+            try:
+                values[key] = decoded[(section, optionxform(option))]
+                continue
+            except (KeyError, TypeError, AttributeError):
                 pass
+            section = self.__check_section_option(section, option)
+            option = optionxform(option)
+            if not self.has_option(section, option):
+                if not self.has_section(section):
+                    raise RuntimeError("Unknown section %r" % section)
+                raise RuntimeError("Unknown option %r" % option)
+            values[key] = self.__get_decoded(section, option)
+        for key, value in values.iteritems():
+            if type(value) in MUTABLE_TYPES:
+                values[key] = copy_value(value)
+        self._cache_hits += len(keys)
+        if self._stats is not None:
+            for section, option in keys:
+                if section is None:
+                    section = default_section
+                self._stats.read((section, optionxform(option)))
+        return values
+
+    def __get_decoded(self, section, option):
+        """
+        Private method returning the decoded value of an existing option
+        (option name being already transformed by 'optionxform')
+        Cache misses are counted here, hits are counted by the caller
+        """
+        key = (section, option)
+        try:
+            value = self._decoded[key]
+        except KeyError:
+            self._cache_misses += 1
+            self._cache_hits -= 1
+            text = self._sections[section].get(option)
+            if text is None:
+                # Default section
+                text = ConfigParser.get(self, section, option, raw=True)
+            if '%' in text:
+                # Interpolated values depend on other options: not cached
+                return self.__decode(section, option,
+                                     ConfigParser.get(self, section, option))
+            value = self.__decode(section, option, text)
+            self._decoded[key] = value
         return value
 
+    def __get_option_codec(self, section, option):
+        """
+        Private method returning the codec of an option
+        """
+        if self._specs:
+            spec = self._specs.get((section, self.optionxform(option)))
+            if spec is not None:
+                return spec.codec
+        return self.__get_codec(self.__get_default(section, option))
+
+    def __decode(self, section, option, value):
+        """
+        Private method decoding the string value of an option
+        """
+        codec = self.__get_option_codec(section, option)
+        if codec.strict:
+            return codec.decode(value)
+        try:
+            # lists, tuples, ...
+            return codec.decode(value)
+        except ValueError:
+            if self._stats is not None:
+                self._stats.decode_failed((section, self.optionxform(option)))
+            return value
+
+    def decode(self, section, option, text):
+        """
+        Return the value of an option represented by text (i.e. written as
+        in the .ini file), decoded with the option codec
+        section=None: attribute a default section name
+        """
+        section = self.__check_section_option(section, option)
+        return self.__decode(section, self.optionxform(option), text)
+
+    def subscribe(self, section, option, callback):
+        """
+        Call callback(section, option, old_value, new_value) when the value
+        of an option changes (set, reset_to_defaults, reload, ...)
+        section, option: '*' matches any section/option
+        (section=None: attribute a default section name)
+        Changes made within a batch (or a single reset_to_defaults call)
+        are notified once per option, when the batch ends
+        NoDefault is passed as old (resp. new) value of added (resp.
+        removed) options
+        """
+        key = self.__subscription_key(section, option)
+        self._subscribers.setdefault(key, []).append(callback)
+
+    def unsubscribe(self, section, option, callback):
+        """
+        Stop calling a callback registered with 'subscribe'
+        """
+        key = self.__subscription_key(section, option)
+        callbacks = self._subscribers.get(key, [])
+        if callback in callbacks:
+            callbacks.remove(callback)
+            if not callbacks:
+                del self._subscribers[key]
+
+    def __subscription_key(self, section, option):
+        """
+        Private method returning the (section, option) subscribers key
+        """
+        section = self.__check_section_option(section, option)
+        if option != '*':
+            option = self.optionxform(option)
+        return section, option
+
+    def __record_change(self, section, option, old_value):
+        """
+        Private method recording the previous (string) value of an option
+        to be notified to subscribers (old_value is NoDefault if the option
+        did not exist)
+        """
+        self._notifications.setdefault((section, option), old_value)
+
+    def __begin_changes(self):
+        """
+        Private method starting a group of notified changes
+        """
+        self._notify_level += 1
+
+    def __end_changes(self):
+        """
+        Private method ending a group of notified changes: call subscribers
+        """
+        self._notify_level -= 1
+        if self._notify_level or not self._notifications:
+            return
+        notifications, self._notifications = self._notifications, {}
+        for (section, option), old_value in notifications.iteritems():
+            options = self._sections.get(section, {})
+            new_value = options.get(option, NoDefault)
+            if new_value == old_value:
+                continue
+            callbacks = []
+            for key in ((section, option), (section, '*'),
+                        ('*', option), ('*', '*')):
+                callbacks += self._subscribers.get(key, [])
+            if not callbacks:
+                continue
+            values = []
+            for value in (old_value, new_value):
+                if value is not NoDefault:
+                    try:
+                        value = self.__decode(section, option, value)
+                    except ValueError:
+                        pass
+                values.append(value)
+            for callback in callbacks:
+                callback(section, option, values[0], values[1])
+
+    def get_cache_info(self):
+        """
+        Return decoded values cache statistics: dictionnary with
+        'hits', 'misses' and 'size' keys
+        (mutable values are copied when returned, see 'copy_value')
+        """
+        return dict(hits=self._cache_hits, misses=self._cache_misses,
+                    size=len(self._decoded))
+
+    def enable_stats(self, sink=None):
+        """
+        Start collecting statistics (see 'stats' module): options read and
+        written, decode failures, loads, saves and bytes written, and
+        get/set/load/save latency histograms (statistics collected so far
+        are reset)
+        sink: function called on each measured event (see stats.Stats)
+        'get' and 'set' are replaced by timed versions on this instance
+        until 'disable_stats' is called (to be called before sharing the
+        config between threads)
+        """
+        if self._stats is not None:
+            self.disable_stats()
+        stats = Stats(sink)
+        optionxform = self.optionxform
+        default_section = self.default_section_name
+        get, set = self.get, self.set
+        def timed_get(section, option, default=NoDefault):
+            start = default_timer()
+            value = get(section, option, default)
+            elapsed = default_timer()-start
+            if section is None:
+                section = default_section
+            stats.read((section, optionxform(option)), elapsed)
+            return value
+        def timed_set(section, option, value, verbose=False, save=True):
+            start = default_timer()
+            set(section, option, value, verbose=verbose, save=save)
+            elapsed = default_timer()-start
+            if section is None:
+                section = default_section
+            stats.set((section, optionxform(option)), elapsed)
+        # Instance methods replaced (None: class method)
+        self._timed_methods = dict([ (name, self.__dict__.get(name))
+                                     for name in ('get', 'set') ])
+        self.get, self.set = timed_get, timed_set
+        self._stats = stats
+
+    def disable_stats(self):
+        """
+        Stop collecting statistics (see 'enable_stats')
+        """
+        if self._stats is None:
+            return
+        for name, method in self._timed_methods.iteritems():
+            if method is None:
+                delattr(self, name)
+            else:
+                setattr(self, name, method)
+        self._stats = self._timed_methods = None
+
+    def stats(self):
+        """
+        Return a snapshot of statistics collected since 'enable_stats'
+        was called (see stats.Stats.snapshot), or None if disabled
+        """
+        if self._stats is not None:
+            return self._stats.snapshot()
+
+    def items(self, section, raw=False, vars=None):
+        """
+        Return a list of (option, value) pairs for each option in section
+        (overriden to load the config file first in lazy mode)
+        """
+        self.__ensure_loaded()
+        if self.auto_reload is not None:
+            self.__check_reload()
+        return ConfigParser.items(self, section, raw, vars)
+
+    def sections(self):
+        """
+        Return a list of section names
+        (overriden to load the config file first in lazy mode)
+        """
+        if self._lazy_args is not None:
+            self.__ensure_loaded()
+        return ConfigParser.sections(self)
+
+    def has_section(self, section):
+        """
+        Return True if section exists
+        (overriden to load the config file first in lazy mode)
+        """
+        if self._lazy_args is not None:
+            self.__ensure_loaded()
+        return ConfigParser.has_section(self, section)
+
+    def options(self, section):
+        """
+        Return a list of option names of section
+        (overriden to load the config file first in lazy mode)
+        """
+        if self._lazy_args is not None:
+            self.__ensure_loaded()
+        return ConfigParser.options(self, section)
+
+    def has_option(self, section, option):
+        """
+        Return True if option exists in section
+        (overriden to load the config file first in lazy mode)
+        """
+        if self._lazy_args is not None:
+            self.__ensure_loaded()
+        return ConfigParser.has_option(self, section, option)
+
+    def write(self, fp):
+        """
+        Write config in .ini format
+        (overriden to load the config file first in lazy mode)
+        """
+        if self._lazy_args is not None:
+            self.__ensure_loaded()
+        ConfigParser.write(self, fp)
+
+    def _read(self, fp, fpname):
+        """
+        Read and parse a .ini file (overriden to invalidate decoded values)
+        """
+        self._decoded.clear()
+        ConfigParser._read(self, fp, fpname)
+
+    def remove_option(self, section, option):
+        """
+        Remove an option (overriden to invalidate decoded values
+        and notify subscribers)
+        """
+        self.__ensure_loaded()
+        option = self.optionxform(option)
+        self._decoded.pop((section, option), None)
+        self.__begin_changes()
+        try:
+            if self._subscribers and self.has_option(section, option):
+                self.__record_change(section, option,
+                                     self._sections[section][option])
+            existed = ConfigParser.remove_option(self, section, option)
+        finally:
+            self.__end_changes()
+        if existed:
+            self._dirty = True
+            if self._changes is not None:
+                self._changes[(section, option)] = NoDefault
+        return existed
+
+    def remove_section(self, section):
+        """
+        Remove a section (overriden to invalidate decoded values
+        and notify subscribers)
+        """
+        self.__ensure_loaded()
+        for key in self._decoded.keys():
+            if key[0] == section:
+                del self._decoded[key]
+        self.__begin_changes()
+        try:
+            if self._subscribers and self.has_section(section):
+                for option, value in self._sections[section].iteritems():
+                    if option != '__name__':
+                        self.__record_change(section, option, value)
+            existed = ConfigParser.remove_section(self, section)
+        finally:
+            self.__end_changes()
+        if existed:
+            self._dirty = True
+            if self._changes is not None:
+                for key in self._changes.keys():
+                    if key[0] == section:
+                        del self._changes[key]
+                self._changes[(section, None)] = SECTION_REMOVED
+        return existed
+
+    def add_section(self, section):
+        """
+        Create a new section (overriden to track unsaved changes)
+        """
+        self.__ensure_loaded()
+        ConfigParser.add_section(self, section)
+        self._dirty = True
+        if self._changes is not None:
+            if self._changes.get((section, None)) == SECTION_REMOVED:
+                self._changes[(section, None)] = SECTION_REPLACED
+            else:
+                self._changes[(section, None)] = SECTION_ADDED
+
     def __set(self, section, option, value, verbose):
         """
         Private set method
         """
+        if self.low_memory:
+            section = intern_string(section)
         if not self.has_section(section):
             self.add_section( section )
         if not isinstance(value, (str, unicode)):
-            value = repr( value )
+            value = self.__get_codec(value).encode(value)
+        if self.low_memory:
+            value = intern_string(value, INTERNED_VALUE_SIZE)
         if verbose:
             print '%s[ %s ] = %s' % (section, option, value)
-        ConfigParser.set(self, section, option, value)
+        option = self.optionxform(option)
+        old_value = self._sections[section].get(option, NoDefault)
+        if old_value != value:
+            self._decoded.pop((section, option), None)
+            self._dirty = True
+            if self._stats is not None:
+                self._stats.write((section, option))
+            if self._subscribers:
+                self.__record_change(section, option, old_value)
+            if self._changes is not None:
+                self._changes[(section, option)] = value
+            ConfigParser.set(self, section, option, value)
 
     def set_default(self, section, option, default_value):
         """
@@ -250,28 +1612,90 @@ class UserConfig(ConfigParser):
         -> called when a new (section, option) is set and no default exists
         """
         section = self.__check_section_option(section, option)
-        for sec, options in self.defaults:
-            if sec == section:
-                options[ option ] = default_value
+        options = self._default_index.get(section)
+        if options is not None:
+            options[ option ] = default_value
+            if section in self._merged_sections:
+                for sec, secdict in self.defaults:
+                    if sec == section:
+                        secdict[ option ] = default_value
+            self._decoded.pop((section, self.optionxform(option)), None)
+
+    def __encode(self, section, option, value):
+        """
+        Private method converting a value to the string stored in the .ini
+        file, according to option schema or default value
+        Return (string, new_default), new_default being True if option has
+        no default value (value has then to be set as default)
+        """
+        if self._specs:
+            spec = self._specs.get((section, self.optionxform(option)))
+            if spec is not None:
+                if spec.validator is not None:
+                    spec.validator(value)
+                return spec.codec.encode(value), False
+        default_value = self.__get_default(section, option)
+        if default_value is NoDefault:
+            return self.__get_codec(value).encode(value), True
+        return self.__get_codec(default_value).encode(value), False
 
     def set(self, section, option, value, verbose=False, save=True):
         """
         Set an option
         section=None: attribute a default section name
         """
+        self.__ensure_loaded()
         section = self.__check_section_option(section, option)
-        default_value = self.get_default(section, option)
-        if default_value is NoDefault:
-            default_value = value
-            self.set_default(section, option, default_value)
-        if isinstance(default_value, bool):
-            value = bool(value)
-        elif isinstance(default_value, float):
-            value = float(value)
-        elif isinstance(default_value, int):
-            value = int(value)
-        else:
-            value = repr(value)
-        self.__set(section, option, value, verbose)
-        if save:
-            self.__save()
+        text, new_default = self.__encode(section, option, value)
+        if new_default:
+            self.set_default(section, option, value)
+        self.__begin_changes()
+        try:
+            self.__set(section, option, text, verbose)
+            if save:
+                self.__save()
+        finally:
+            self.__end_changes()
+
+    def update(self, options, verbose=False, save=True):
+        """
+        Set several options at once, saving config only once
+        options: dictionnary {section: {option: value}}
+                 *or* iterable of (section, option, value)
+        (section=None: attribute a default section name)
+        Values are all converted before changing any option: if one of them
+        can't be converted to its default value type, an exception is raised
+        and config is left unchanged
+        """
+        self.__ensure_loaded()
+        if hasattr(options, 'items'):
+            options = [ (section, option, value)
+                        for section, secdict in options.items()
+                        for option, value in secdict.items() ]
+        encoded = []
+        for section, option, value in options:
+            section = self.__check_section_option(section, option)
+            if section.lower() == 'default':
+                # Rejected by ConfigParser.add_section (whatever the case)
+                raise RuntimeError("Invalid section name %r" % section)
+            text, new_default = self.__encode(section, option, value)
+            encoded.append( (section, option, new_default, value, text) )
+        self.__begin_changes()
+        try:
+            for section, option, new_default, value, text in encoded:
+                if new_default:
+                    self.set_default(section, option, value)
+                self.__set(section, option, text, verbose)
+            if save:
+                self.__save()
+        finally:
+            self.__end_changes()
+
+    def set_section(self, section, options, verbose=False, save=True):
+        """
+        Set several options of a section at once (see 'update')
+        section=None: attribute a default section name
+        """
+        self.update([ (section, option, value)
+                      for option, value in options.items() ],
+                    verbose=verbose, save=save)